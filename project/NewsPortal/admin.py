@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Post, Category, PostCategory
+from .models import Post, Category, PostCategory, CensoredWord
 from modeltranslation.admin import TranslationAdmin
 from .translation import Post, Category
 
@@ -22,11 +22,13 @@ class CategoryAdmin(TranslationAdmin):
 
 class PostAdmin(TranslationAdmin):
     model = Post
+    readonly_fields = ('rating',)  # рейтинг меняется только голосами, см. NewsPortal.votes
 
 
 admin.site.register(Category)
 admin.site.register(Post, PostAdmin)
 admin.site.register(PostCategory)
+admin.site.register(CensoredWord)
 
 
 
@@ -0,0 +1,204 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page
+
+from .caching import conditional_post_page
+from .filters import PostFilter
+from .models import Category, Comment, Post, PostCategory
+from .pagination import InvalidCursor, KeysetPaginator
+from .querybudget import QueryBudgetMixin
+
+
+# JSON API только для чтения: /api/v1/posts/, /api/v1/posts/<pk>/, /api/v1/posts/<pk>/comments/, /api/v1/categories/.
+# Строки читаются через values() только по запрошенным полям (?fields=title,time_in), страницы — по курсору
+# (?cursor=..., ?limit=...), фильтры постов те же, что у PostFilter на /posts/.
+# Число запросов к базе на страницу не зависит от её размера (query_budget, сценарии api_* в benchmark_views).
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# поле ответа -> колонка для values(); переводимые колонки modeltranslation отдаёт на текущем языке
+POST_FIELDS = {
+    'id': 'pk',
+    'type': 'type',
+    'time_in': 'time_in',
+    'updated_at': 'updated_at',
+    'title': 'title_censored',
+    'excerpt': 'excerpt',
+    'text': 'text_censored',
+    'rating': 'rating',
+    'author': 'author__username',
+    'categories': None,  # id категорий, отдельным запросом на всю страницу
+}
+DEFAULT_POST_FIELDS = ('id', 'type', 'time_in', 'title', 'excerpt', 'author', 'categories')
+
+COMMENT_FIELDS = {
+    'id': 'pk',
+    'time_in': 'time_in',
+    'text': 'text_censored',
+    'rating': 'rating',
+    'user': 'user__username',
+}
+DEFAULT_COMMENT_FIELDS = tuple(COMMENT_FIELDS)
+
+CATEGORY_FIELDS = {
+    'id': 'pk',
+    'name': 'name',
+    'post_count': 'stats__post_count',
+}
+DEFAULT_CATEGORY_FIELDS = tuple(CATEGORY_FIELDS)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def json_response(data, status=200):
+    # компактно и в одном порядке ключей: меньше байт и лучше сжимается
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return HttpResponse(body, content_type='application/json; charset=utf-8', status=status)
+
+
+def parse_fields(request, available, default):
+    """Поля из ?fields=a,b в порядке запроса; без параметра — default."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return default
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(available)}')
+    return tuple(names)
+
+
+def parse_limit(request):
+    raw = request.GET.get('limit')
+    if raw is None:
+        return API_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise ApiError(f'limit должен быть от 1 до {API_MAX_PAGE_SIZE}')
+    return limit
+
+
+def columns(fields, mapping):
+    # pk и time_in нужны всегда: по ним строится курсор
+    return list(dict.fromkeys(['pk', 'time_in'] + [mapping[name] for name in fields if mapping[name]]))
+
+
+def serialize(rows, fields, mapping, extra=None):
+    extra = extra or {}
+    return [{name: extra[name][row['pk']] if name in extra else row[mapping[name]] for name in fields}
+            for row in rows]
+
+
+def post_categories(post_ids):
+    """{id поста: [id категорий]} для страницы одним запросом."""
+    categories = {pk: [] for pk in post_ids}
+    for post_id, category_id in (PostCategory.objects.filter(post_id__in=post_ids)
+                                 .order_by('category_id').values_list('post_id', 'category_id')):
+        categories[post_id].append(category_id)
+    return categories
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return f'{request.path}?{query.urlencode()}'
+
+
+class ApiView(QueryBudgetMixin, View):
+    """Только GET; ошибки параметров — 400 с {"error": ...}."""
+    http_method_names = ['get', 'head', 'options']
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as exc:
+            data = {'error': str(exc)}
+            if exc.details:
+                data['details'] = exc.details
+            return json_response(data, status=exc.status)
+
+    def paginate(self, queryset):
+        """(строки страницы, ссылка на следующую, ссылка на предыдущую) по ключу (time_in, pk)."""
+        paginator = KeysetPaginator(queryset, parse_limit(self.request), key=lambda row: (row['time_in'], row['pk']))
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise ApiError('Неверный курсор страницы')
+        return page.object_list, page_link(self.request, page.next_cursor), page_link(self.request, page.previous_cursor)
+
+
+class PostListApi(ApiView):
+    query_budget = 3  # посты, категории страницы и проверка ?category=
+
+    def get(self, request):
+        fields = parse_fields(request, POST_FIELDS, DEFAULT_POST_FIELDS)
+        filterset = PostFilter(request.GET, Post.objects.all())
+        if not filterset.is_valid():
+            raise ApiError('Неверные параметры фильтра', details=filterset.errors.get_json_data())
+        rows, next_link, previous_link = self.paginate(filterset.qs.values(*columns(fields, POST_FIELDS)))
+        extra = {'categories': post_categories([row['pk'] for row in rows])} if 'categories' in fields else None
+        return json_response({
+            'results': serialize(rows, fields, POST_FIELDS, extra),
+            'next': next_link,
+            'previous': previous_link,
+        })
+
+
+class PostDetailApi(ApiView):
+    query_budget = 2  # пост и его категории; версию поста до этого читает conditional_post_page
+
+    def get(self, request, pk):
+        fields = parse_fields(request, POST_FIELDS, DEFAULT_POST_FIELDS)
+        row = Post.objects.filter(pk=pk).values(*columns(fields, POST_FIELDS)).first()
+        if row is None:
+            raise ApiError('Пост не найден', status=404)
+        extra = {'categories': post_categories([pk])} if 'categories' in fields else None
+        return json_response(serialize([row], fields, POST_FIELDS, extra)[0])
+
+
+class CommentListApi(ApiView):
+    query_budget = 2  # проверка поста и комментарии
+
+    def get(self, request, pk):
+        fields = parse_fields(request, COMMENT_FIELDS, DEFAULT_COMMENT_FIELDS)
+        if not Post.objects.filter(pk=pk).exists():
+            raise ApiError('Пост не найден', status=404)
+        queryset = Comment.objects.filter(post_id=pk).values(*columns(fields, COMMENT_FIELDS))
+        rows, next_link, previous_link = self.paginate(queryset)
+        return json_response({
+            'results': serialize(rows, fields, COMMENT_FIELDS),
+            'next': next_link,
+            'previous': previous_link,
+        })
+
+
+class CategoryListApi(ApiView):
+    query_budget = 1
+
+    def get(self, request):
+        # категорий немного, поэтому без страниц
+        fields = parse_fields(request, CATEGORY_FIELDS, DEFAULT_CATEGORY_FIELDS)
+        rows = Category.objects.order_by('pk').values(*dict.fromkeys(['pk'] + [CATEGORY_FIELDS[name] for name in fields]))
+        return json_response({'results': serialize(rows, fields, CATEGORY_FIELDS)})
+
+
+# списки получают ETag по телу ответа, пост — по своей версии, как и HTML-страница поста
+post_list_api = gzip_page(conditional_page(PostListApi.as_view()))
+post_detail_api = gzip_page(conditional_post_page(PostDetailApi.as_view()))
+comment_list_api = gzip_page(conditional_page(CommentListApi.as_view()))
+category_list_api = gzip_page(conditional_page(CategoryListApi.as_view()))
@@ -0,0 +1,122 @@
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404
+from django.template.response import TemplateResponse
+
+from .caching import CACHE_TIMEOUT, aget_or_set_tagged, atags_version, post_page_tags
+from .models import Post, UserPostCounter
+from .pagination import InvalidCursor, KeysetPaginator
+from .rows import post_rows, post_values
+from .views import ArticleDetailView, CategoryPost, PostDetailView, PostList, SearchResultsView
+
+
+# Async-версии страниц чтения для ASGI (settings.ASYNC_VIEWS, см. urls.py): те же шаблоны и контекст,
+# что у PostList, PostDetailView, ArticleDetailView, CategoryPost и SearchResultsView, но данные
+# читаются через async ORM и async-методы кэша. TemplateResponse Django рисует в потоке сам,
+# поэтому ленивые связи, права и формы фильтров в шаблонах работают как раньше.
+
+
+async def load_user(request):
+    """request.user (сессия и пользователь из базы) загружается в потоке, дальше он уже в памяти."""
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+async def cursor_page(request, queryset, per_page, count_mode='none', count=None, transform=None):
+    paginator = KeysetPaginator(queryset, per_page, count_mode=count_mode, count=count, transform=transform)
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Неверный курсор страницы')
+    # шаблон показывает paginator.count: считаем заранее
+    await paginator.acount()
+    return paginator, page
+
+
+def page_context(paginator, page, name):
+    return {
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages(),
+        'object_list': page.object_list,
+        name: page.object_list,
+    }
+
+
+async def post_list(request):
+    user = await load_user(request)
+    view = PostList()
+    view.setup(request)
+    # фильтр по категориям при проверке читает категории из базы
+    queryset = await sync_to_async(view.get_queryset)()
+    paginator, page = await cursor_page(request, queryset, view.paginate_by, count_mode=view.count_mode,
+                                        transform=view.page_transform)
+
+    context = page_context(paginator, page, view.context_object_name)
+    if user.is_authenticated:
+        counts = await sync_to_async(UserPostCounter.objects.counts)(user.pk)
+        context['user_today_posts_count'] = counts.today
+        context['user_posts_count'] = counts.total
+        context['user_daily_post_limit'] = counts.limit
+    context['time_now'] = datetime.utcnow()
+    context['next_post'] = None
+    context['filterset'] = view.filterset
+    context['cache_timeout'] = CACHE_TIMEOUT
+    context['cache_version'] = await atags_version(['posts'])
+    return TemplateResponse(request, view.template_name, context)
+
+
+async def load_post(pk):
+    try:
+        return await PostDetailView.queryset.aget(pk=pk)
+    except Post.DoesNotExist:
+        raise Http404('Пост не найден')
+
+
+async def post_detail(request, pk):
+    # тот же ключ и теги, что у PostDetailView.get_object: кэш общий для обеих версий
+    tags = await sync_to_async(post_page_tags)(pk)
+    post = await aget_or_set_tagged(f'post-{pk}', tags, lambda: load_post(pk))
+    return TemplateResponse(request, PostDetailView.template_name,
+                            {'object': post, PostDetailView.context_object_name: post})
+
+
+async def article_detail(request, pk):
+    try:
+        article = await ArticleDetailView.queryset.aget(pk=pk)
+    except Post.DoesNotExist:
+        raise Http404('Статья не найдена')
+    return TemplateResponse(request, ArticleDetailView.template_name,
+                            {'object': article, ArticleDetailView.context_object_name: article, 'title': article.title})
+
+
+async def category_posts(request, pk):
+    category = await CategoryPost.queryset.filter(pk=pk).afirst()
+    if category is None:
+        raise Http404('Категория не найдена')
+    stats = getattr(category, 'stats', None)
+    paginator, page = await cursor_page(request, post_values(Post.objects.filter(category=category)),
+                                        CategoryPost.paginate_by, count_mode='estimate',
+                                        count=stats.post_count if stats else None, transform=post_rows)
+    context = {'object': category, CategoryPost.context_object_name: category}
+    context.update(page_context(paginator, page, 'posts'))
+    return TemplateResponse(request, CategoryPost.template_name, context)
+
+
+async def search_results(request):
+    view = SearchResultsView()
+    view.setup(request)
+    queryset = view.get_queryset()
+    paginator = Paginator(queryset, view.paginate_by)
+    paginator.count = await queryset.acount()
+    try:
+        page = paginator.page(request.GET.get(view.page_kwarg) or 1)
+    except InvalidPage:
+        raise Http404('Неверный номер страницы')
+    page.object_list = [post async for post in page.object_list]
+
+    context = page_context(paginator, page, view.context_object_name)
+    context['query'] = request.GET.get('q', '')
+    return TemplateResponse(request, view.template_name, context)
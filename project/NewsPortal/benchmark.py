@@ -0,0 +1,302 @@
+import asyncio
+import math
+import random
+import re
+import statistics
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .bulk import import_posts, purge_posts, refresh_after_bulk_change
+from .models import Author, Category, CategorySubscribe, DailyPostLimit, Post, article, news
+from .pagination import encode_cursor
+from .subscriptions import invalidate_subscribers, unsubscribe
+
+
+# Данные для замеров производительности: всё, что создаёт генератор, начинается с BENCH_PREFIX,
+# поэтому набор можно удалить и пересоздать, не трогая настоящие данные
+
+BENCH_PREFIX = 'bench_'
+DATASET_SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+CATEGORY_COUNT = 20
+WORDS = ('новости', 'спорт', 'политика', 'экономика', 'погода', 'кино', 'музыка', 'наука', 'технологии',
+         'выборы', 'футбол', 'хоккей', 'рынок', 'нефть', 'рубль', 'космос', 'школа', 'здоровье', 'театр',
+         'выставка', 'город', 'транспорт', 'интервью', 'премьера', 'рекорд', 'матч', 'бюджет', 'закон')
+
+
+def zipf_weights(count, exponent=1.0):
+    # популярность категорий и авторов спадает как 1/rank: несколько крупных и длинный хвост
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def generate_rows(posts, seed, base_time, authors):
+    """Детерминированный поток строк для import_posts: одни и те же seed и base_time дают те же посты."""
+    rnd = random.Random(seed)
+    category_names = [f'{BENCH_PREFIX}category_{i}' for i in range(CATEGORY_COUNT)]
+    category_weights = zipf_weights(CATEGORY_COUNT)
+    author_names = [f'{BENCH_PREFIX}author_{i}' for i in range(authors)]
+    author_weights = zipf_weights(authors, exponent=0.8)
+    for i in range(posts):
+        # даты за последний год, свежих постов больше, чем старых
+        age = timedelta(days=365 * rnd.random() ** 2, seconds=rnd.randrange(86400))
+        categories = set(rnd.choices(category_names, category_weights, k=1 + int(rnd.random() < 0.3)))
+        yield {
+            'title': ' '.join(rnd.choices(WORDS, k=rnd.randint(3, 8))).capitalize(),
+            'text': ' '.join(rnd.choices(WORDS, k=rnd.randint(40, 400))),
+            'type': article if rnd.random() < 0.3 else news,
+            'author': rnd.choices(author_names, author_weights)[0],
+            'categories': sorted(categories),
+            'time_in': (base_time - age).isoformat(),
+            'rating': int(rnd.gauss(0, 5)),
+        }
+
+
+def seed_subscribers(count, seed, batch_size=5000):
+    """Пользователи-подписчики: у каждого 1-4 категории, популярные категории выбирают чаще."""
+    rnd = random.Random(seed + 1)
+    categories = list(Category.objects.filter(name__startswith=BENCH_PREFIX).order_by('name').values_list('pk', flat=True))
+    weights = zipf_weights(len(categories))
+    for start in range(0, count, batch_size):
+        names = [f'{BENCH_PREFIX}reader_{i}' for i in range(start, min(start + batch_size, count))]
+        User.objects.bulk_create([User(username=name, email=f'{name}@example.com') for name in names],
+                                 ignore_conflicts=True)
+        user_ids = User.objects.filter(username__in=names).order_by('username').values_list('pk', flat=True)
+        CategorySubscribe.objects.bulk_create([
+            CategorySubscribe(subscriber_id=user_id, category_id=category_id)
+            for user_id in user_ids
+            for category_id in set(rnd.choices(categories, weights, k=rnd.randint(1, 4)))
+        ], batch_size=batch_size)
+        invalidate_subscribers(categories)
+        yield min(start + batch_size, count)
+
+
+def flush_dataset(batch_size=5000):
+    """Удаляет всё, что создал генератор."""
+    for _ in purge_posts(Post.objects.filter(author__username__startswith=BENCH_PREFIX), batch_size=batch_size):
+        pass
+    bench_users = User.objects.filter(username__startswith=BENCH_PREFIX).values_list('pk', flat=True)
+    unsubscribe(bench_users, CategorySubscribe.objects.filter(subscriber__in=bench_users)
+                .values_list('category_id', flat=True).distinct())
+    Author.objects.filter(users__username__startswith=BENCH_PREFIX).delete()
+    DailyPostLimit.objects.filter(user__username__startswith=BENCH_PREFIX).delete()
+    User.objects.filter(username__startswith=BENCH_PREFIX).delete()
+    Category.objects.filter(name__startswith=BENCH_PREFIX).delete()
+    refresh_after_bulk_change()
+
+
+def seed_dataset(posts, seed=42, base_time=None, batch_size=5000):
+    """Создаёт набор: посты, авторов, категории и posts // 10 подписчиков. Отдаёт строки прогресса."""
+    base_time = base_time or timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    authors = max(10, posts // 200)
+    imported = 0
+    first_pk = last_pk = None
+    for batch, category_ids, errors in import_posts(generate_rows(posts, seed, base_time, authors),
+                                                    batch_size=batch_size,
+                                                    create_authors=True, create_categories=True):
+        imported += len(batch)
+        if batch:
+            first_pk = batch[0].pk if first_pk is None else first_pk
+            last_pk = batch[-1].pk
+        yield f'постов: {imported}'
+
+    author_users = User.objects.filter(username__startswith=f'{BENCH_PREFIX}author_')
+    Author.objects.bulk_create([Author(name=username, users_id=pk) for pk, username in
+                                author_users.exclude(author__isnull=False).values_list('pk', 'username')],
+                               ignore_conflicts=True)
+    # пользователь, от имени которого меряем страницы и создание постов
+    editor, _ = User.objects.get_or_create(username=f'{BENCH_PREFIX}editor', defaults={'email': 'editor@example.com'})
+    editor.user_permissions.add(*Permission.objects.filter(codename__in=['add_post', 'change_post']))
+    DailyPostLimit.objects.update_or_create(user=editor, defaults={'limit': 10 ** 9})
+    Author.objects.get_or_create(users=editor, defaults={'name': editor.username})
+
+    for done in seed_subscribers(posts // 10, seed, batch_size=batch_size):
+        yield f'подписчиков: {done}'
+    refresh_after_bulk_change(author_ids=list(author_users.values_list('pk', flat=True)),
+                              posts=Post.objects.filter(pk__gte=first_pk or 0, pk__lte=last_pk or 0))
+    yield 'индекс, счётчики и рейтинги обновлены'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+def measure(name, call, iterations, warmup=2, before=None, rollback=False):
+    """
+    Время (мс) и число запросов к базе для call(); before() вызывается перед каждым замером
+    (например, чтобы очистить кэш), rollback=True откатывает изменения каждого прогона.
+    """
+    timings, queries, statuses = [], [], set()
+    for i in range(warmup + iterations):
+        if before:
+            before()
+        with transaction.atomic() if rollback else nullcontext():
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                result = call()
+                elapsed = (time.perf_counter() - started) * 1000
+            if rollback:
+                transaction.set_rollback(True)
+        mail.outbox = []
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(len(captured))
+            statuses.add(getattr(result, 'status_code', None))
+    return summary(name, iterations, timings, queries, statuses)
+
+
+def summary(name, iterations, timings, queries, statuses):
+    return {
+        'name': name,
+        'iterations': iterations,
+        'status_codes': sorted(status for status in statuses if status is not None),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': max(queries),
+    }
+
+
+SERVER_TIMING_SQL = re.compile(r'SQL x(\d+)')
+ASYNC_CONCURRENCY = 20
+
+
+async def ameasure(name, client, path, data, iterations, concurrency=ASYNC_CONCURRENCY, warmup=2):
+    """
+    Как measure, но через AsyncClient (ASGI), и каждый прогон — concurrency одновременных запросов.
+    Запросы к базе идут из потоков sync_to_async, поэтому их число берётся из Server-Timing.
+    """
+    async def request():
+        started = time.perf_counter()
+        response = await client.get(path, data)
+        elapsed = (time.perf_counter() - started) * 1000
+        match = SERVER_TIMING_SQL.search(response.get('Server-Timing', ''))
+        return elapsed, int(match.group(1)) if match else 0, response.status_code
+
+    for _ in range(warmup):
+        await request()
+    results = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        results += await asyncio.gather(*[request() for _ in range(concurrency)])
+    wall = time.perf_counter() - started
+    row = summary(name, iterations, [r[0] for r in results], [r[1] for r in results], {r[2] for r in results})
+    row['concurrency'] = concurrency
+    row['requests_per_second'] = round(len(results) / wall, 1)
+    return row
+
+
+def bench_targets():
+    """Редактор, популярный пост, самая большая категория и курсор глубоко в ленте."""
+    editor = User.objects.get(username=f'{BENCH_PREFIX}editor')
+    bench_posts = Post.objects.filter(author__username__startswith=f'{BENCH_PREFIX}author_')
+    popular = bench_posts.order_by('-time_in').values_list('pk', flat=True).first()
+    category = Category.objects.filter(name=f'{BENCH_PREFIX}category_0').values_list('pk', flat=True).first()
+    # курсор глубоко в ленте: страница, до которой OFFSET пришлось бы пролистывать
+    deep = bench_posts.order_by('-time_in', '-id').values_list('time_in', 'pk')[
+        min(bench_posts.count() - 1, 5000)]
+    return editor, popular, category, encode_cursor('n', *deep)
+
+
+def scenarios():
+    """(название, функция запроса, параметры measure) для горячих страниц и фоновых задач."""
+    from .digest import send_weekly_digest
+    from .outbox import dispatch_outbox
+    from .tasks import send_post_for_subscribers_celery
+    from .votes import flush_rating_deltas
+
+    editor, popular, category, deep_cursor = bench_targets()
+    client = Client()
+    client.force_login(editor)
+    new_post = {'title': 'Замер создания', 'text': 'Текст нового поста для замера ' * 3, 'type': news,
+                'author': editor.pk, 'category': [category]}
+
+    return [
+        ('post_list', lambda: client.get('/posts/'), {}),
+        ('post_list_deep_cursor', lambda: client.get(f'/posts/?cursor={deep_cursor}'), {}),
+        ('post_detail_cold', lambda: client.get(f'/news/{popular}/'), {'before': cache.clear}),
+        ('post_detail_warm', lambda: client.get(f'/news/{popular}/'), {}),
+        ('category_cold', lambda: client.get(f'/category/{category}/'), {'before': cache.clear}),
+        ('category_warm', lambda: client.get(f'/category/{category}/'), {}),
+        # API: число запросов на страницу фиксировано, compare() отметит его рост
+        ('api_post_list', lambda: client.get('/api/v1/posts/', {'limit': 100}), {}),
+        ('api_post_list_sparse', lambda: client.get('/api/v1/posts/', {'limit': 100, 'fields': 'id,title,time_in'}), {}),
+        ('api_post_list_deep_cursor', lambda: client.get('/api/v1/posts/', {'cursor': deep_cursor}), {}),
+        ('api_post_detail', lambda: client.get(f'/api/v1/posts/{popular}/', {'fields': 'id,title,text,categories'}), {}),
+        ('search', lambda: client.get('/search/', {'q': 'футбол матч'}), {}),
+        ('search_in_category', lambda: client.get('/search/', {'q': 'рынок', 'Category': category}), {}),
+        ('post_create', lambda: client.post('/news/create/', new_post), {'rollback': True}),
+        # задачи вызываются синхронно, вложенные .delay() выполняются сразу (task_always_eager)
+        ('task_post_fanout', lambda: send_post_for_subscribers_celery(popular), {'rollback': True, 'warmup': 0}),
+        ('task_weekly_digest', lambda: send_weekly_digest(), {'rollback': True, 'warmup': 0}),
+        ('task_flush_votes', lambda: flush_rating_deltas(), {}),
+        ('task_dispatch_outbox', lambda: dispatch_outbox(), {'rollback': True}),
+    ]
+
+
+def async_scenarios():
+    """(название, путь, параметры) страниц чтения для режима --async: под ASGI они async при ASYNC_VIEWS."""
+    editor, popular, category, deep_cursor = bench_targets()
+    return editor, [
+        ('asgi_post_list', '/posts/', {}),
+        ('asgi_post_list_deep_cursor', '/posts/', {'cursor': deep_cursor}),
+        ('asgi_post_detail_warm', f'/news/{popular}/', {}),
+        ('asgi_category_warm', f'/category/{category}/', {}),
+        ('asgi_search', '/search/', {'q': 'футбол матч'}),
+    ]
+
+
+def dataset_info():
+    return {
+        'posts': Post.objects.filter(author__username__startswith=BENCH_PREFIX).count(),
+        'subscriptions': CategorySubscribe.objects.filter(subscriber__username__startswith=BENCH_PREFIX).count(),
+        'database': connection.vendor,
+        'async_views': settings.ASYNC_VIEWS,
+    }
+
+
+def run_benchmarks(iterations=20, only=None):
+    results = []
+    for name, call, options in scenarios():
+        if only and name not in only:
+            continue
+        # фоновые задачи тяжелее страниц: меряем их реже
+        task_iterations = max(1, iterations // 10) if name.startswith('task_') else iterations
+        results.append(measure(name, call, task_iterations, **options))
+        yield results[-1]
+
+
+def run_async_benchmarks(iterations=20, only=None, concurrency=ASYNC_CONCURRENCY):
+    """Сравнение sync и async страниц: два прогона, с NEWSPORTAL_ASYNC_VIEWS=0 и =1, и --compare."""
+    editor, pages = async_scenarios()
+    client = AsyncClient()
+    client.force_login(editor)
+    for name, path, data in pages:
+        if only and name not in only:
+            continue
+        yield asyncio.run(ameasure(name, client, path, data, iterations, concurrency=concurrency))
+
+
+def compare(results, baseline, max_regression):
+    """Сценарии, которые стали медленнее базового прогона больше чем на max_regression процентов (по p50)."""
+    baseline = {row['name']: row for row in baseline}
+    regressions = []
+    for row in results:
+        old = baseline.get(row['name'])
+        if old is None or not old['p50_ms']:
+            continue
+        change = (row['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+        if change > max_regression or row['queries'] > old['queries']:
+            regressions.append((row['name'], old['p50_ms'], row['p50_ms'], old['queries'], row['queries']))
+    return regressions
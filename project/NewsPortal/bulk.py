@@ -0,0 +1,206 @@
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import invalidate_tags
+from .models import (TYPE, Author, Category, CategoryStats, Comment, CommentVote, Post, PostCategory, PostVote,
+                     RatingDelta, UserPostCounter, article, news)
+from .search import rebuild_search_index
+
+
+# Массовые операции с постами в обход save() и сигналов: строки пишутся bulk_create-ом,
+# а всё, что обычно делают сигналы (индекс, счётчики, рейтинги, кэш), выполняется один раз в конце
+
+POST_TYPES = {code: code for code, name in TYPE} | {'article': article, 'news': news}
+
+
+class RowError(ValueError):
+    pass
+
+
+class LookupMap:
+    """
+    Имя -> id с подгрузкой пачками: на каждую пачку строк один запрос за ещё не известными именами.
+    При create=True недостающие объекты создаются тем же bulk_create-ом.
+    """
+    def __init__(self, model, field, create=False, defaults=None):
+        self.model = model
+        self.field = field
+        self.create = create
+        self.defaults = defaults or {}
+        self.ids = {}
+        self.missing = set()
+
+    def load(self, names):
+        names = {name for name in names if name and name not in self.ids and name not in self.missing}
+        if not names:
+            return
+        found = dict(self.model.objects.filter(**{f'{self.field}__in': names}).values_list(self.field, 'pk'))
+        if self.create and len(found) < len(names):
+            new_names = names - found.keys()
+            self.model.objects.bulk_create([self.model(**{self.field: name}, **self.defaults) for name in new_names],
+                                           ignore_conflicts=True)
+            found.update(self.model.objects.filter(**{f'{self.field}__in': new_names}).values_list(self.field, 'pk'))
+        self.ids.update(found)
+        self.missing.update(names - found.keys())
+
+    def get(self, name):
+        return self.ids.get(name)
+
+
+def build_post(row, authors, categories, now):
+    """Строка источника -> (Post, [category_id, ...]); RowError, если строку импортировать нельзя."""
+    title, text = (row.get('title') or '').strip(), row.get('text') or ''
+    if not title or not text:
+        raise RowError('нет заголовка или текста')
+    post_type = POST_TYPES.get((row.get('type') or news).strip())
+    if post_type is None:
+        raise RowError(f'неизвестный тип {row.get("type")!r}')
+    author_id = authors.get(row.get('author'))
+    if author_id is None:
+        raise RowError(f'неизвестный автор {row.get("author")!r}')
+    category_ids = [categories.get(name) for name in row.get('categories') or ()]
+    if None in category_ids:
+        raise RowError(f'неизвестная категория в {row["categories"]!r}')
+
+    time_in = now
+    if row.get('time_in'):
+        time_in = parse_datetime(str(row['time_in']))
+        if time_in is None:
+            raise RowError(f'неверная дата {row["time_in"]!r}')
+        if timezone.is_naive(time_in):
+            time_in = timezone.make_aware(time_in)
+
+    post = Post(author_id=author_id, type=post_type, time_in=time_in, title=title, text=text,
+                rating=int(row.get('rating') or 0))
+    # английская версия modeltranslation, если она есть в источнике
+    for field in ('title_en_us', 'text_en_us'):
+        if row.get(field):
+            setattr(post, field, row[field])
+    post.apply_censorship()
+    return post, category_ids
+
+
+def import_posts(rows, batch_size=5000, create_authors=False, create_categories=False):
+    """
+    Импортирует посты из итератора словарей (title, text, type, author, categories, time_in, rating).
+    categories — список названий. Память ограничена одной пачкой; после каждой пачки отдаёт
+    ([сохранённые посты], {id затронутых категорий}, [(номер строки, причина пропуска), ...]).
+    """
+    authors = LookupMap(User, 'username', create=create_authors)
+    categories = LookupMap(Category, 'name', create=create_categories)
+    now = timezone.now()
+
+    def flush(batch, first_line):
+        authors.load(row.get('author') for row in batch)
+        categories.load(name for row in batch for name in row.get('categories') or ())
+        posts, links, errors = [], [], []
+        for line, row in enumerate(batch, start=first_line):
+            try:
+                post, category_ids = build_post(row, authors, categories, now)
+            except ValueError as exc:
+                errors.append((line, str(exc)))
+                continue
+            posts.append(post)
+            links.append(category_ids)
+        times = [post.time_in for post in posts]
+        with transaction.atomic():
+            Post.objects.bulk_create(posts, batch_size=batch_size)
+            # bulk_create ставит time_in по auto_now_add; даты из источника возвращаем одним UPDATE на пачку,
+            # не выключая auto_now_add у поля: оно общее для всех потоков процесса
+            for post, time_in in zip(posts, times):
+                post.time_in = time_in
+            Post.objects.bulk_update(posts, ['time_in'], batch_size=batch_size)
+            PostCategory.objects.bulk_create(
+                [PostCategory(post_id=post.pk, category_id=category_id)
+                 for post, category_ids in zip(posts, links) for category_id in category_ids],
+                batch_size=batch_size,
+            )
+        return posts, {pk for category_ids in links for pk in category_ids}, errors
+
+    batch, first_line = [], 1
+    for line, row in enumerate(rows, start=1):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield flush(batch, first_line)
+            batch, first_line = [], line + 1
+    if batch:
+        yield flush(batch, first_line)
+
+
+def delete_rows(model, **conditions):
+    """
+    DELETE ... WHERE <поле> IN (...) AND ... одним запросом, без загрузки объектов и без сигналов:
+    у Post, Comment, PostCategory и CategorySubscribe есть получатели post_delete, и QuerySet.delete()
+    ради них читал бы каждую удаляемую строку. Списки значений — не больше одной пачки.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    where, params = [], []
+    for field, values in conditions.items():
+        values = list(values)
+        where.append(f'{quote(model._meta.get_field(field).column)} IN ({", ".join(["%s"] * len(values))})')
+        params += values
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(model._meta.db_table)} WHERE {" AND ".join(where)}', params)
+        return cursor.rowcount
+
+
+def purge_stats(posts):
+    """Сколько строк удалит purge_posts: для --dry-run."""
+    return {
+        'posts': posts.count(),
+        'comments': Comment.objects.filter(post__in=posts).count(),
+        'votes': (PostVote.objects.filter(post__in=posts).count() +
+                  CommentVote.objects.filter(comment__post__in=posts).count()),
+    }
+
+
+def purge_posts(posts, batch_size=1000):
+    """
+    Удаляет посты выборки пачками по первичному ключу, каждая пачка — своя короткая транзакция.
+    Комментарии, голоса, буфер рейтинга и связи с категориями удаляются явно, сигналы не вызываются.
+    После каждой пачки отдаёт (удалено постов, id затронутых авторов, id затронутых категорий).
+    """
+    posts = posts.order_by('pk')
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            rows = list(posts.filter(pk__gt=last_pk).values_list('pk', 'author_id')[:batch_size])
+            if not rows:
+                break
+            pks = sorted({pk for pk, author_id in rows})
+            author_ids = {author_id for pk, author_id in rows}
+            author_ids.update(Comment.objects.filter(post_id__in=pks).values_list('user_id', flat=True).distinct())
+            category_ids = set(PostCategory.objects.filter(post_id__in=pks).values_list('category_id', flat=True))
+
+            # у голосов и буфера рейтинга нет ни сигналов, ни зависимых таблиц: delete() удаляет их
+            # одним запросом, не читая строк
+            RatingDelta.objects.filter(Q(post_id__in=pks) | Q(comment__post_id__in=pks)).delete()
+            CommentVote.objects.filter(comment__post_id__in=pks).delete()
+            PostVote.objects.filter(post_id__in=pks).delete()
+            delete_rows(Comment, post=pks)
+            delete_rows(PostCategory, post=pks)
+            delete_rows(Post, id=pks)
+        # кэш страниц удалённых постов сбрасываем сразу, не дожидаясь конца
+        invalidate_tags(*[f'post:{pk}' for pk in pks])
+        last_pk = pks[-1]
+        yield len(pks), author_ids, category_ids
+
+
+def refresh_after_bulk_change(author_ids=(), category_ids=(), posts=None):
+    """
+    То, что при обычном save()/delete() делают сигналы, один раз для всей массовой операции:
+    поисковый индекс (posts — выборка новых или изменённых постов), счётчики постов и категорий,
+    рейтинги авторов и кэш списков.
+    """
+    if posts is not None:
+        for _ in rebuild_search_index(queryset=posts):
+            pass
+    UserPostCounter.objects.rebuild()
+    CategoryStats.objects.rebuild()
+    if author_ids:
+        Author.objects.filter(users_id__in=author_ids).recompute_rating()
+    invalidate_tags('posts', 'categories', *[f'category:{pk}' for pk in category_ids])
@@ -0,0 +1,436 @@
+import asyncio
+import logging
+import math
+import random
+import re
+import time
+from functools import wraps
+from hashlib import md5
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from .instrumentation import timer
+
+logger = logging.getLogger(__name__)
+
+
+# Записи кэша помечаются тегами: post:<id>, category:<id>, author:<user_id>, posts (все списки),
+# categories (список категорий). У каждого тега в кэше лежит версия, и версии всех тегов
+# входят в ключ записи. Сброс тега = новая версия: все зависящие от него записи
+# перестают находиться одним вызовом и доживают своё по TTL.
+CACHE_TIMEOUT = getattr(settings, 'TAGGED_CACHE_TIMEOUT', 60 * 60 * 6)
+# сколько после истечения (или сброса тега) можно отдавать старую копию, пока её пересчитывают
+STALE_GRACE = getattr(settings, 'CACHE_STALE_GRACE', 60 * 5)
+# коэффициент вероятностного раннего обновления (XFetch): больше — обновляем раньше
+EARLY_REFRESH_BETA = 1.0
+LOCK_TIMEOUT = 30
+LEADER_WAIT = 1.0
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def _new_version():
+    # время, а не счётчик: если версию вытеснят из кэша, новая не совпадёт ни с одной из старых
+    return time.time_ns()
+
+
+def tag_versions(tags):
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+async def atag_versions(tags):
+    keys = {_tag_key(tag): tag for tag in tags}
+    found = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return {tag: found[key] for key, tag in keys.items()}
+
+
+def _versions_digest(versions):
+    return md5(';'.join(f'{tag}={versions[tag]}' for tag in sorted(versions)).encode()).hexdigest()
+
+
+def tags_version(tags):
+    """Одна строка, меняющаяся при сбросе любого из тегов: для ключей и {% cache %}."""
+    return _versions_digest(tag_versions(tags))
+
+
+async def atags_version(tags):
+    return _versions_digest(await atag_versions(tags))
+
+
+def tagged_key(key, tags):
+    return f'{key}:{tags_version(tags)}'
+
+
+def invalidate_tags(*tags):
+    if tags:
+        cache.set_many({_tag_key(tag): _new_version() for tag in tags}, None)
+
+
+class CacheEntry:
+    __slots__ = ('value', 'expires_at', 'delta')
+
+    def __init__(self, value, expires_at, delta):
+        self.value = value
+        self.expires_at = expires_at  # мягкое истечение, физически запись живёт ещё STALE_GRACE
+        self.delta = delta  # сколько секунд занял пересчёт
+
+    def __getstate__(self):
+        return self.value, self.expires_at, self.delta
+
+    def __setstate__(self, state):
+        self.value, self.expires_at, self.delta = state
+
+    def is_fresh(self, now):
+        # XFetch: чем дороже пересчёт и ближе истечение, тем вероятнее кто-то обновит запись заранее
+        return now - self.delta * EARLY_REFRESH_BETA * math.log(1 - random.random()) < self.expires_at
+
+    def is_usable(self, now, grace):
+        return now < self.expires_at + grace
+
+
+def _recompute_steps(key, timeout, stale_key, grace, cacheable):
+    """
+    Ход get_or_recompute одним генератором для обеих версий: он отдаёт операции (имя метода кэша
+    и аргументы, 'sleep' или 'compute'), а get_or_recompute / aget_or_recompute выполняют их
+    обычными или async-вызовами и отправляют результат (или исключение) обратно.
+    """
+    now = time.time()
+    entry = yield 'get', key
+    if entry is not None and entry.is_fresh(now):
+        return entry.value
+    if entry is None and stale_key is not None:
+        entry = yield 'get', stale_key
+    stale = entry if entry is not None and entry.is_usable(now, grace) else None
+
+    lock_key = f'lock:{stale_key or key}'
+    token = uuid4().hex
+    acquired = yield 'add', lock_key, token, LOCK_TIMEOUT
+    if not acquired:
+        if stale is not None:
+            return stale.value
+        # старой копии нет: немного ждём, пока пересчитает тот, кто взял блокировку
+        deadline = now + LEADER_WAIT
+        while time.time() < deadline:
+            yield 'sleep', 0.05
+            entry = yield 'get', key
+            if entry is not None:
+                return entry.value
+        # не дождались: считаем сами, но чужую блокировку не трогаем
+
+    try:
+        started = time.time()
+        try:
+            value = yield 'compute',
+        except DatabaseError:
+            if stale is None:
+                raise
+            logger.warning('Database unavailable, serving stale cache entry %s', key, exc_info=True)
+            return stale.value
+        if cacheable is None or cacheable(value):
+            finished = time.time()
+            entry = CacheEntry(value, finished + timeout, finished - started)
+            yield 'set_many', {k: entry for k in (key, stale_key) if k is not None}, timeout + grace
+        return value
+    finally:
+        # снимаем только свою блокировку: она могла истечь по LOCK_TIMEOUT и достаться другому запросу
+        if acquired and (yield 'get', lock_key) == token:
+            yield 'delete', lock_key
+
+
+def get_or_recompute(key, compute, timeout=CACHE_TIMEOUT, stale_key=None, grace=STALE_GRACE, cacheable=None):
+    """
+    Значение из кэша с защитой от одновременного пересчёта.
+
+    Пересчитывает только тот запрос, который взял блокировку; остальные в это время
+    получают старую копию (не старше grace после истечения). Если при пересчёте
+    недоступна база, тоже отдаётся старая копия. stale_key — стабильный ключ,
+    где старая копия переживает сброс тегов (смену версии в основном ключе).
+
+    Блокировка — cache.add(), поэтому пересчёт в одном экземпляре гарантирует только кэш,
+    где add() атомарен между процессами: Redis или Memcached. У FileBasedCache add() — это
+    проверка и запись по отдельности, и при наплыве пересчитать могут несколько процессов сразу.
+    """
+    steps = _recompute_steps(key, timeout, stale_key, grace, cacheable)
+    result = error = None
+    while True:
+        try:
+            operation, *args = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        try:
+            if operation == 'compute':
+                result = compute()
+            elif operation == 'sleep':
+                time.sleep(*args)
+            else:
+                result = getattr(cache, operation)(*args)
+        except BaseException as exc:
+            # в т.ч. отмена задачи: генератор всё равно снимет свою блокировку в finally
+            error = exc
+
+
+async def aget_or_recompute(key, compute, timeout=CACHE_TIMEOUT, stale_key=None, grace=STALE_GRACE, cacheable=None):
+    """get_or_recompute для async-представлений: compute — корутинная функция, ожидание лидера не занимает поток."""
+    steps = _recompute_steps(key, timeout, stale_key, grace, cacheable)
+    result = error = None
+    while True:
+        try:
+            operation, *args = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as stop:
+            return stop.value
+        result = error = None
+        try:
+            if operation == 'compute':
+                result = await compute()
+            elif operation == 'sleep':
+                await asyncio.sleep(*args)
+            else:
+                result = await getattr(cache, f'a{operation}')(*args)
+        except BaseException as exc:
+            # в т.ч. отмена задачи: генератор всё равно снимет свою блокировку в finally
+            error = exc
+
+
+def get_or_set_tagged(key, tags, compute, timeout=CACHE_TIMEOUT):
+    return get_or_recompute(tagged_key(key, tags), compute, timeout=timeout, stale_key=f'stale:{key}')
+
+
+async def aget_or_set_tagged(key, tags, compute, timeout=CACHE_TIMEOUT):
+    return await aget_or_recompute(f'{key}:{await atags_version(tags)}', compute, timeout=timeout,
+                                   stale_key=f'stale:{key}')
+
+
+def post_tags(post_id, author_id=None, category_ids=()):
+    tags = ['posts', f'post:{post_id}']
+    if author_id is not None:
+        tags.append(f'author:{author_id}')
+    tags += [f'category:{category_id}' for category_id in category_ids]
+    return tags
+
+
+def post_page_tags(post_id):
+    """Теги страницы поста: сам пост, его автор и категории (берутся из кэша, а при промахе из базы)."""
+    from .models import Post, PostCategory
+
+    def load():
+        author_id = Post.objects.filter(pk=post_id).values_list('author_id', flat=True).first()
+        category_ids = list(PostCategory.objects.filter(post_id=post_id).values_list('category_id', flat=True))
+        return [tag for tag in post_tags(post_id, author_id, category_ids) if tag != 'posts']
+
+    return get_or_set_tagged(f'post-tags-{post_id}', [f'post:{post_id}'], load)
+
+
+def invalidate_post(post_id, author_id=None, category_ids=None):
+    from .models import PostCategory
+
+    if category_ids is None:
+        category_ids = PostCategory.objects.filter(post_id=post_id).values_list('category_id', flat=True)
+    invalidate_tags(*post_tags(post_id, author_id, category_ids))
+
+
+# {% csrf_token %} рисует токен из cookie конкретного посетителя. В общей копии страницы значение
+# токена вырезается, а при каждой выдаче подставляется токен текущего запроса: get_token заодно
+# просит CsrfViewMiddleware поставить посетителю cookie и добавить Vary: Cookie.
+CSRF_INPUT_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_EMPTY_INPUT = b'name="csrfmiddlewaretoken" value=""'
+
+
+def _is_cacheable_response(request, response):
+    if response.status_code != 200 or response.streaming or response.has_header('Set-Cookie'):
+        return False
+    # страница читала сессию (пользователя, сообщения) — она своя у каждого посетителя, как при Vary: Cookie
+    session = getattr(request, 'session', None)
+    return session is None or not session.accessed
+
+
+def _share_page(request, response):
+    if _is_cacheable_response(request, response):
+        response.content = CSRF_INPUT_RE.sub(rb'\1\2', response.content)
+    return response
+
+
+def _with_csrf_token(request, response):
+    if not response.streaming and CSRF_EMPTY_INPUT in response.content:
+        token = get_token(request).encode()
+        response.content = CSRF_INPUT_RE.sub(rb'\g<1>' + token + rb'\2', response.content)
+    return response
+
+
+def _render(response):
+    if hasattr(response, 'render') and callable(response.render):
+        with timer('template'):
+            response = response.render()
+    return response
+
+
+def cache_page_tagged(tags, timeout=CACHE_TIMEOUT):
+    """
+    Кэш страницы целиком: как cache_page, только версии тегов входят в ключ,
+    а пересчёт защищён от наплыва запросов (см. get_or_recompute).
+    tags(request, **kwargs) возвращает теги страницы. Работает и с async-представлениями.
+    Копия общая для всех посетителей: страницы, читавшие сессию, не кэшируются,
+    а токен CSRF в формах подставляется свой при каждой выдаче.
+    """
+    def page_key(request):
+        url = md5(request.build_absolute_uri().encode()).hexdigest()
+        return f'page:{url}:{get_language()}'
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+
+                async def render():
+                    # шаблон может обратиться к базе (права, ленивые связи), поэтому рисуется в потоке
+                    response = await sync_to_async(_render)(await view(request, *args, **kwargs))
+                    return _share_page(request, response)
+
+                key = page_key(request)
+                version = _versions_digest(await atag_versions(await sync_to_async(tags)(request, **kwargs)))
+                response = await aget_or_recompute(f'{key}:{version}', render, timeout=timeout, stale_key=f'stale:{key}',
+                                                   cacheable=lambda response: _is_cacheable_response(request, response))
+                return _with_csrf_token(request, response)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            def render():
+                return _share_page(request, _render(view(request, *args, **kwargs)))
+
+            key = page_key(request)
+            version = tags_version(tags(request, **kwargs))
+            response = get_or_recompute(f'{key}:{version}', render, timeout=timeout, stale_key=f'stale:{key}',
+                                        cacheable=lambda response: _is_cacheable_response(request, response))
+            return _with_csrf_token(request, response)
+        return wrapper
+    return decorator
+
+
+def _post_validators(post_id, state):
+    if state is None:
+        return None
+    version, updated_at = state
+    # Last-Modified с точностью до секунды, правки внутри одной секунды различает версия в ETag
+    last_modified = int(updated_at.timestamp())
+    return quote_etag(f'post-{post_id}-{version}-{last_modified}-{get_language()}'), last_modified
+
+
+def post_validators(post_id):
+    """(ETag, Last-Modified) страницы поста по его версии — один запрос по первичному ключу; None, если поста нет."""
+    from .models import Post
+
+    return _post_validators(post_id, Post.objects.filter(pk=post_id).values_list('version', 'updated_at').first())
+
+
+async def apost_validators(post_id):
+    from .models import Post
+
+    return _post_validators(post_id, await Post.objects.filter(pk=post_id).values_list('version', 'updated_at').afirst())
+
+
+def _conditional_response(request, validators):
+    etag, last_modified = validators
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _set_validators(response, validators):
+    if response.status_code in (200, 304):
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # браузер и прокси могут хранить страницу, но перед показом переспрашивают
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _stamp_post_page(view):
+    # ETag и Last-Modified ставятся при рендере, по версии, которую conditional_post_page прочитал до него:
+    # копия страницы в кэше хранит валидаторы своей версии, даже если её отдают после правки поста
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            response = await view(request, *args, **kwargs)
+            validators = getattr(request, 'post_validators', None)
+            return response if validators is None else _set_validators(response, validators)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        validators = getattr(request, 'post_validators', None)
+        return response if validators is None else _set_validators(response, validators)
+    return wrapper
+
+
+def _finish_post_page(response, validators):
+    # у отрисованной страницы валидаторы уже свои; старая копия, которую отдают в окне STALE_GRACE,
+    # не должна получить ETag новой версии, иначе браузер так и будет получать на неё 304
+    if response.has_header('ETag'):
+        return response
+    return _set_validators(response, validators)
+
+
+def conditional_post_page(view, cache_page=None):
+    """
+    Условный GET для страниц поста: If-None-Match / If-Modified-Since сверяются с версией поста,
+    и при совпадении сразу отдаётся 304 без загрузки поста и рендера шаблона.
+    cache_page — кэш страницы (cache_page_tagged) между проверкой версии и представлением.
+    """
+    view = _stamp_post_page(view)
+    if cache_page is not None:
+        view = cache_page(view)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            validators = await apost_validators(kwargs['pk'])
+            if validators is None:
+                return await view(request, *args, **kwargs)
+            response = _conditional_response(request, validators)
+            if response is not None:
+                return _set_validators(response, validators)
+            request.post_validators = validators
+            return _finish_post_page(await view(request, *args, **kwargs), validators)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        validators = post_validators(kwargs['pk'])
+        if validators is None:
+            return view(request, *args, **kwargs)
+        response = _conditional_response(request, validators)
+        if response is not None:
+            return _set_validators(response, validators)
+        request.post_validators = validators
+        return _finish_post_page(view(request, *args, **kwargs), validators)
+    return wrapper
@@ -0,0 +1,169 @@
+import re
+import threading
+import time
+from functools import lru_cache
+
+from modeltranslation.settings import AVAILABLE_LANGUAGES
+from modeltranslation.utils import build_localized_fieldname
+
+from .caching import invalidate_tags, tag_versions
+
+
+# Цензура: словарь (CensoredWord) компилируется в одно регулярное выражение-дерево по основам слов.
+# Цензурированные заголовок и текст считаются один раз при сохранении поста или комментария
+# и хранятся в *_censored; фильтр censor остаётся для прочих строк и кэширует результат.
+
+DICTIONARY_TAG = 'censored_words'
+# как часто процесс сверяет версию словаря (изменения из других процессов видны с этой задержкой)
+RELOAD_INTERVAL = 60
+RENDER_CACHE_SIZE = 1024
+
+# окончания, которые отрезаются от слова словаря: "образование" -> "образован", и под шаблон
+# "образован\w*" попадают "образования", "Образованием", "ОБРАЗОВАНИЕ"
+ENDINGS = sorted({
+    'иями', 'ями', 'ами', 'ией', 'ием', 'иях', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ие', 'ия', 'ии', 'ий', 'ию', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ых', 'их', 'ую', 'юю', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+}, key=len, reverse=True)
+MIN_STEM = 3
+
+
+def stem(word):
+    word = word.strip().lower().replace('ё', 'е')
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def _trie_pattern(node):
+    # основа, которая уже закончилась, покрывает все более длинные: дальше хвост ловит \w*
+    if '' in node:
+        return ''
+    branches = [('[её]' if char == 'е' else re.escape(char)) + _trie_pattern(child)
+                for char, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+
+def compile_words(words):
+    """Один шаблон на весь словарь: префиксное дерево основ + любое окончание, без учёта регистра."""
+    trie = {}
+    for word in words:
+        word = stem(word)
+        if not word:
+            continue
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    if not trie:
+        return None
+    return re.compile(r'\b' + _trie_pattern(trie) + r'\w*', re.IGNORECASE)
+
+
+def _mask(match):
+    word = match.group()
+    return word[0] + '*' * (len(word) - 1)
+
+
+def censor_text(pattern, text):
+    """Первая буква слова остаётся, остальные заменяются на *."""
+    if not text or pattern is None:
+        return text
+    return pattern.sub(_mask, text)
+
+
+def localized_pairs(model, source, target):
+    """[(source, target)] и такие же пары языковых версий modeltranslation, если они есть у модели."""
+    names = {field.name for field in model._meta.concrete_fields}
+    candidates = [(source, target)] + [
+        (build_localized_fieldname(source, lang), build_localized_fieldname(target, lang))
+        for lang in AVAILABLE_LANGUAGES
+    ]
+    return [(a, b) for a, b in candidates if a in names and b in names]
+
+
+def censored_fields(model, sources):
+    """[(исходное поле, поле с цензурой)] вместе с языковыми версиями."""
+    return [pair for source in sources for pair in localized_pairs(model, source, f'{source}_censored')]
+
+
+class Dictionary:
+    """Скомпилированный словарь процесса; перечитывается из базы, когда меняется версия тега."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = 0.0
+        self.pattern = None
+
+    def get_pattern(self):
+        now = time.monotonic()
+        if self.version is not None and now - self.checked < RELOAD_INTERVAL:
+            return self.pattern
+        with self.lock:
+            version = tag_versions([DICTIONARY_TAG])[DICTIONARY_TAG]
+            if version != self.version:
+                from .models import CensoredWord
+                self.pattern = compile_words(CensoredWord.objects.values_list('word', flat=True))
+                self.version = version
+            self.checked = now
+        return self.pattern
+
+    def reset(self):
+        # словарь изменился в этом процессе: перечитываем сразу, остальным сообщает новая версия тега
+        self.version = None
+        invalidate_tags(DICTIONARY_TAG)
+
+
+dictionary = Dictionary()
+
+
+def censor(text):
+    return censor_text(dictionary.get_pattern(), text)
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(pattern, text):
+    return censor_text(pattern, text)
+
+
+def censor_cached(text):
+    """Для шаблонов: одинаковые строки не сканируются повторно, пока словарь не изменился."""
+    return _render(dictionary.get_pattern(), text)
+
+
+def recensor(model, batch_size=1000):
+    """
+    Пересчитывает цензурированные поля модели по текущему словарю пачками по первичному ключу;
+    записываются только изменившиеся строки. Отдаёт список pk изменённых строк после каждой пачки.
+    """
+    fields = model.derived_fields()
+    last_pk = 0
+    while True:
+        # целиком, без only(): modeltranslation переписал бы имена полей на поля текущего языка
+        objects = list(model.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+        if not objects:
+            break
+        changed = [obj for obj in objects if obj.apply_censorship()]
+        if changed:
+            model.objects.bulk_update(changed, fields, batch_size=batch_size)
+        last_pk = objects[-1].pk
+        yield [obj.pk for obj in changed]
+
+
+def recensor_all(batch_size=1000):
+    """Пересчёт постов и комментариев после изменения словаря; возвращает (постов, комментариев) изменено."""
+    from .models import Comment, Post, touch_posts
+    posts = comments = 0
+    for pks in recensor(Post, batch_size):
+        posts += len(pks)
+        if pks:
+            touch_posts(Post.objects.filter(pk__in=pks))
+        invalidate_tags(*[f'post:{pk}' for pk in pks])
+    for pks in recensor(Comment, batch_size):
+        comments += len(pks)
+    if posts:
+        invalidate_tags('posts')
+    return posts, comments
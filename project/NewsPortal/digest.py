@@ -0,0 +1,119 @@
+from collections import OrderedDict, defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.urls import reverse
+from django.utils import timezone
+
+from .mailing import chunked
+from .models import CategorySubscribe, PostCategory, article
+
+
+DIGEST_BATCH_SIZE = 500
+# сколько разных наборов категорий держим уже отрендеренными
+RENDER_CACHE_SIZE = 1000
+
+
+# запросы рассылки отдельными функциями: index_advisor (explain.py) проверяет планы ровно этих запросов
+
+def week_posts(since):
+    return (PostCategory.objects
+            .filter(post__time_in__gte=since)
+            .order_by('-post__time_in', 'post_id')
+            .values_list('category_id', 'post_id', 'post__title_censored', 'post__type'))
+
+
+def subscriptions(category_ids):
+    return (CategorySubscribe.objects
+            .filter(category_id__in=category_ids)
+            .exclude(subscriber__email='')
+            .order_by('subscriber_id', 'category_id')
+            .values_list('subscriber_id', 'subscriber__username', 'subscriber__email', 'category_id'))
+
+
+def week_posts_by_category(since):
+    """Один проход по постам недели: {category_id: [(post_id, title, url), ...]}, новые первыми."""
+    groups = defaultdict(list)
+    for category_id, post_id, title, post_type in week_posts(since):
+        url = reverse('article' if post_type == article else 'some_news', args=[post_id])
+        groups[category_id].append((post_id, title, url))
+    return groups
+
+
+def subscribers_with_categories(category_ids, chunk_size=2000):
+    """
+    Потоком отдаёт (username, email, frozenset(category_id)) — каждого подписчика один раз.
+    Подписки читаются одним запросом по порядку subscriber_id через iterator() пачками по chunk_size
+    и собираются по пользователю на лету: в памяти только подписки текущего пользователя.
+    """
+    rows = subscriptions(category_ids).iterator(chunk_size=chunk_size)
+    for user_id, group in groupby(rows, key=itemgetter(0)):
+        group = list(group)
+        yield group[0][1], group[0][2], frozenset(row[3] for row in group)
+
+
+class DigestRenderer:
+    """Рендерит письмо один раз на набор категорий: у подписчиков с одинаковыми подписками оно одно и то же."""
+
+    def __init__(self, groups, cache_size=RENDER_CACHE_SIZE):
+        self.groups = groups
+        self.cache_size = cache_size
+        self.template = get_template('posts/weekly_digest.html')
+        self._rendered = OrderedDict()
+
+    def render(self, categories):
+        html = self._rendered.get(categories)
+        if html is not None:
+            self._rendered.move_to_end(categories)
+            return html
+
+        posts, seen = [], set()
+        for category_id in sorted(categories):
+            for post_id, title, url in self.groups[category_id]:
+                if post_id not in seen:
+                    seen.add(post_id)
+                    posts.append({'id': post_id, 'title': title, 'url': url})
+        posts.sort(key=lambda post: post['id'], reverse=True)
+        html = self.template.render({'link': settings.SITE_URL, 'posts': posts})
+
+        self._rendered[categories] = html
+        if len(self._rendered) > self.cache_size:
+            self._rendered.popitem(last=False)
+        return html
+
+
+def digest_messages(groups, subscribers):
+    renderer = DigestRenderer(groups)
+    for username, email, categories in subscribers:
+        message = EmailMultiAlternatives(
+            subject='Новости за неделю',
+            body=f'Здравствуй, {username}! Все статьи твоих любимых категорий за неделю: {settings.SITE_URL}',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+        )
+        message.attach_alternative(renderer.render(categories), 'text/html')
+        yield message
+
+
+def send_weekly_digest(since=None, batch_size=DIGEST_BATCH_SIZE, connection=None):
+    """
+    Еженедельная рассылка: каждому подписчику только посты его категорий.
+
+    Посты недели читаются один раз, подписчики идут потоком, письма уходят пачками
+    по batch_size через одно соединение: память не растёт с числом подписчиков.
+    Общая реализация для Celery (tasks.weekly_post) и APScheduler (runapscheduler).
+    """
+    since = since or timezone.now() - timezone.timedelta(days=7)
+    groups = week_posts_by_category(since)
+    if not groups:
+        return 0
+
+    connection = connection or get_connection()
+    sent = 0
+    messages = digest_messages(groups, subscribers_with_categories(list(groups)))
+    for batch in chunked(messages, batch_size):
+        sent += connection.send_messages(batch)
+    return sent
@@ -0,0 +1,101 @@
+import re
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import digest
+from .models import Author, Category, CategorySubscribe, Post, PostCategory
+
+
+# Планы горячих запросов проекта: какие индексы они используют, где читают таблицу целиком
+# и каких из нужных им индексов нет в базе. Смотреть имеет смысл на реальном объёме
+# (seed_benchmark_data): на маленьких таблицах планировщику дешевле полный проход.
+
+HotQuery = namedtuple('HotQuery', 'name queryset indexes')
+Report = namedtuple('Report', 'name plan used_indexes full_scans sorts missing_indexes')
+
+PG_INDEX = re.compile(r'(?:Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on) (\w+)')
+PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+PG_SORT = re.compile(r'\bSort  \(')
+# SQLite: "SCAN NewsPortal_post", "SCAN ... USING COVERING INDEX x", "SEARCH ... USING INDEX x (...)"
+SQLITE_STEP = re.compile(r'\b(SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?INDEX (\w+))?')
+
+
+def hot_queries():
+    """Запросы страниц и фоновых задач с параметрами, взятыми из самих данных."""
+    now = timezone.now()
+    category_id = (Category.objects.order_by('-stats__post_count').values_list('pk', flat=True).first()) or 0
+    author_id = Post.objects.order_by('-time_in').values_list('author_id', flat=True).first() or 0
+    # середина ленты: курсор, с которого начинается одна из глубоких страниц
+    offset = Post.objects.count() // 2
+    middle = list(Post.objects.order_by('-time_in', '-id').values_list('time_in', 'pk')[offset:offset + 1])
+    middle = middle[0] if middle else (now, 0)
+    day_start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    feed = Post.objects.select_related('author')
+
+    return [
+        HotQuery('post_list', feed.order_by('-time_in', '-id')[:11], ['post_time_in_id_idx']),
+        HotQuery('post_list_cursor',
+                 feed.filter(Q(time_in__lt=middle[0]) | Q(time_in=middle[0], id__lt=middle[1]))
+                 .order_by('-time_in', '-id')[:11],
+                 ['post_time_in_id_idx']),
+        HotQuery('filter_rating', feed.filter(rating__gt=10).order_by('-time_in', '-id')[:11],
+                 ['post_rating_idx', 'post_time_in_id_idx']),
+        HotQuery('filter_date', feed.filter(time_in__gte=now - timedelta(days=30)).order_by('-time_in', '-id')[:11],
+                 ['post_time_in_id_idx']),
+        HotQuery('category_page', feed.filter(category=category_id).order_by('-time_in', '-id')[:11],
+                 ['postcategory_category_post_idx']),
+        HotQuery('author_posts', Post.objects.filter(author_id=author_id).order_by('-time_in')[:10],
+                 ['post_author_time_idx']),
+        HotQuery('daily_limit_count', Post.objects.filter(author_id=author_id, time_in__gte=day_start),
+                 ['post_author_time_idx']),
+        HotQuery('weekly_digest', digest.week_posts(now - timedelta(days=7)), ['post_time_in_id_idx']),
+        HotQuery('digest_subscribers', digest.subscriptions([category_id]), ['unique_category_subscriber']),
+        HotQuery('category_subscribers',
+                 CategorySubscribe.objects.filter(category_id__in=[category_id])
+                 .order_by('category_id', 'subscriber_id').values_list('category_id', 'subscriber_id'),
+                 ['unique_category_subscriber']),
+        HotQuery('top_authors', Author.objects.order_by('-user_rating', 'pk').values('name', 'user_rating')[:10],
+                 ['author_rating_idx']),
+    ]
+
+
+def existing_indexes(tables):
+    """Имена индексов и уникальных ограничений, которые есть в базе, по всем таблицам."""
+    names = set()
+    with connection.cursor() as cursor:
+        for table in tables:
+            for name, info in connection.introspection.get_constraints(cursor, table).items():
+                if info['index'] or info['unique']:
+                    names.add(name)
+    return names
+
+
+def parse_plan(queryset, analyze=False):
+    """(текст плана, использованные индексы, таблицы, прочитанные целиком, есть ли отдельная сортировка)."""
+    if connection.vendor == 'postgresql':
+        plan = queryset.explain(analyze=analyze, buffers=analyze)
+        return plan, set(PG_INDEX.findall(plan)), set(PG_SEQ_SCAN.findall(plan)), bool(PG_SORT.search(plan))
+    if connection.vendor == 'sqlite':
+        plan = queryset.explain()
+        used, scans = set(), set()
+        for step, table, index in SQLITE_STEP.findall(plan):
+            if index:
+                used.add(index)
+            elif step == 'SCAN':
+                scans.add(table)
+        return plan, used, scans, 'USE TEMP B-TREE' in plan
+    raise NotImplementedError(f'EXPLAIN для {connection.vendor} не поддерживается')
+
+
+def advise(only=None, analyze=False):
+    queries = [query for query in hot_queries() if not only or query.name in only]
+    tables = {model._meta.db_table for model in (Post, PostCategory, CategorySubscribe, Author, Category)}
+    present = existing_indexes(tables)
+    for query in queries:
+        plan, used, scans, sorts = parse_plan(query.queryset, analyze=analyze)
+        yield Report(query.name, plan, sorted(used), sorted(scans), sorts,
+                     [name for name in query.indexes if name not in present])
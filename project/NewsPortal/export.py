@@ -0,0 +1,87 @@
+import csv
+import json
+from collections import defaultdict
+from datetime import datetime, time
+from itertools import islice
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Category, Post, PostCategory
+
+
+# Выгрузка постов в JSON Lines или CSV в тех же полях, что читает importposts.
+# Строки идут потоком: iterator() (на PostgreSQL — серверный курсор) пачками по chunk_size,
+# на каждую пачку один запрос за категориями, так что память не зависит от числа постов.
+
+EXPORT_FIELDS = ('id', 'title', 'text', 'type', 'author', 'categories', 'time_in', 'rating')
+EXPORT_COLUMNS = ('pk', 'title', 'text', 'type', 'author__username', 'time_in', 'rating')
+EXPORT_CHUNK_SIZE = 2000
+CATEGORY_SEPARATOR = ';'
+
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def export_queryset(since=None, until=None, categories=None):
+    """Посты за период [since, until] (даты включительно) и/или в категориях, по времени публикации."""
+    queryset = Post.objects.all()
+    if since:
+        queryset = queryset.filter(time_in__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    if until:
+        queryset = queryset.filter(time_in__lte=timezone.make_aware(datetime.combine(until, time.max)))
+    if categories:
+        # подзапрос вместо JOIN: пост из нескольких выбранных категорий не повторяется
+        queryset = queryset.filter(pk__in=PostCategory.objects.filter(category__in=categories).values('post_id'))
+    return queryset.order_by('time_in', 'pk')
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Словари с полями EXPORT_FIELDS; категории — список названий."""
+    rows = queryset.values(*EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        names = defaultdict(list)
+        for post_id, name in (Category.objects.filter(postcategory__post_id__in=[row['pk'] for row in chunk])
+                              .order_by('name').values_list('postcategory__post_id', 'name')):
+            names[post_id].append(name)
+        for row in chunk:
+            yield {
+                'id': row['pk'],
+                'title': row['title'],
+                'text': row['text'],
+                'type': row['type'],
+                'author': row['author__username'],
+                'categories': names[row['pk']],
+                'time_in': row['time_in'],
+                'rating': row['rating'],
+            }
+
+
+class Echo:
+    """Файл для csv.writer, который не копит строки, а возвращает их."""
+    def write(self, value):
+        return value
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows, separator=CATEGORY_SEPARATOR):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        row['categories'] = separator.join(row['categories'])
+        row['time_in'] = row['time_in'].isoformat()
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def export_lines(file_format, queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    rows = export_rows(queryset, chunk_size=chunk_size)
+    return csv_lines(rows) if file_format == 'csv' else jsonl_lines(rows)
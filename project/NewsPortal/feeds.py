@@ -0,0 +1,131 @@
+import json
+from hashlib import md5
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed, Rss201rev2Feed
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from .caching import get_or_set_tagged, tags_version
+from .models import Category, Post
+from .rows import post_rows, post_values
+
+
+# Ленты новых постов: весь сайт и отдельные категории, RSS 2.0, Atom и JSON Feed.
+# Готовое тело ленты лежит в кэше с тегом posts (или category:<id>) и сбрасывается вместе с ним.
+# ETag — хэш версии тегов, поэтому ответ 304 не трогает ни базу, ни тело ленты.
+
+FEED_SIZE = 20
+FEED_FORMATS = {
+    'rss': Rss201rev2Feed,
+    'atom': Atom1Feed,
+    'json': None,
+}
+JSON_FEED_CONTENT_TYPE = 'application/feed+json; charset=utf-8'
+
+
+class FeedEntry:
+    __slots__ = ('body', 'content_type', 'etag', 'last_modified')
+
+    def __init__(self, body, content_type, etag, last_modified):
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def __getstate__(self):
+        return self.body, self.content_type, self.etag, self.last_modified
+
+    def __setstate__(self, state):
+        self.body, self.content_type, self.etag, self.last_modified = state
+
+
+def feed_etag(fmt, pk, tags):
+    version = tags_version(tags)
+    return quote_etag(md5(f'{fmt}:{pk}:{get_language()}:{version}'.encode()).hexdigest())
+
+
+def feed_kwargs(fmt, category):
+    return {'fmt': fmt} if category is None else {'fmt': fmt, 'pk': category.pk}
+
+
+def feed_meta(category):
+    if category is None:
+        return 'NewsPortal', reverse('post_list'), 'Новые новости и статьи'
+    return f'NewsPortal: {category.name}', reverse('category', args=[category.pk]), f'Новые посты в категории {category.name}'
+
+
+def json_feed(title, link, feed_url, description, posts):
+    return json.dumps({
+        'version': 'https://jsonfeed.org/version/1.1',
+        'title': title,
+        'home_page_url': link,
+        'feed_url': feed_url,
+        'description': description,
+        'language': get_language(),
+        'items': [{
+            'id': url,
+            'url': url,
+            'title': post.title,
+            'summary': post.excerpt,
+            'content_text': post.excerpt,
+            'date_published': post.time_in.isoformat(),
+            'authors': [{'name': post.author_name}],
+            'tags': post.categories,
+        } for post, url in posts],
+    }, ensure_ascii=False)
+
+
+def render_feed(fmt, category, tags):
+    # ETag считается до чтения постов: если посты изменятся во время сборки, следующий запрос получит новую ленту
+    etag = feed_etag(fmt, category and category.pk, tags)
+    queryset = Post.objects.all() if category is None else Post.objects.filter(category=category)
+    posts = post_rows(post_values(queryset.order_by('-time_in', '-id'))[:FEED_SIZE])
+    title, path, description = feed_meta(category)
+    link = f'{settings.SITE_URL}{path}'
+    feed_url = f'{settings.SITE_URL}{reverse("feed" if category is None else "category_feed", kwargs=feed_kwargs(fmt, category))}'
+    items = [(post, f'{settings.SITE_URL}{post.get_absolute_url()}') for post in posts]
+    last_modified = posts[0].time_in if posts else None
+
+    if fmt == 'json':
+        body = json_feed(title, link, feed_url, description, items)
+        return FeedEntry(body.encode(), JSON_FEED_CONTENT_TYPE, etag, last_modified)
+
+    feed = FEED_FORMATS[fmt](title=title, link=link, description=description, feed_url=feed_url,
+                             language=get_language())
+    for post, url in items:
+        feed.add_item(title=post.title, link=url, description=post.excerpt, unique_id=url,
+                      pubdate=post.time_in, author_name=post.author_name, categories=post.categories)
+    return FeedEntry(feed.writeString('utf-8').encode(), feed.content_type, etag, last_modified)
+
+
+def feed_view(request, fmt, pk=None):
+    """Лента в формате fmt (rss, atom, json); pk — лента одной категории."""
+    if fmt not in FEED_FORMATS:
+        raise Http404
+    tags = ['posts'] if pk is None else [f'category:{pk}']
+
+    # клиент уже видел текущую версию ленты: 304 без базы и без тела
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        etag = feed_etag(fmt, pk, tags)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+            return response
+
+    category = None if pk is None else get_object_or_404(Category, pk=pk)
+    entry = get_or_set_tagged(f'feed:{fmt}:{pk or "all"}:{get_language()}', tags,
+                              lambda: render_feed(fmt, category, tags))
+    # заголовок Last-Modified с точностью до секунды, иначе If-Modified-Since никогда не совпадёт
+    last_modified = int(entry.last_modified.timestamp()) if entry.last_modified else None
+    response = get_conditional_response(request, etag=entry.etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(entry.body, content_type=entry.content_type)
+    response['ETag'] = entry.etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Post
+from .models import Category, Post
 from django.core.exceptions import ValidationError
 
 
@@ -8,14 +8,14 @@ class PostForm(forms.ModelForm):
 
     class Meta:
         model = Post
-        fields = ('title', 'text', 'author', 'category', 'rating', 'type',)
+        # рейтинг меняется только голосами, см. NewsPortal.votes
+        fields = ('title', 'text', 'author', 'category', 'type',)
 
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'author': forms.Select(attrs={'class': 'form-control'}),
             'text': forms.TextInput(attrs={'class': 'form-control'}),
             'category': forms.SelectMultiple(attrs={'class': 'form-control'}),
-            'rating': forms.TextInput(attrs={'class': 'form-control'}),
             'type': forms.Select(attrs={'class': 'form-control'}),
         }
 
@@ -29,3 +29,18 @@ class PostForm(forms.ModelForm):
             )
         return cleaned_data
 
+
+class ExportForm(forms.Form):
+    """Параметры выгрузки постов: период (даты включительно), категории и формат."""
+    since = forms.DateField(required=False)
+    until = forms.DateField(required=False)
+    category = forms.ModelMultipleChoiceField(queryset=Category.objects.all(), required=False)
+    format = forms.ChoiceField(choices=[('jsonl', 'JSON Lines'), ('csv', 'CSV')], required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since > until:
+            raise ValidationError('Начало периода позже его конца.')
+        cleaned_data['format'] = cleaned_data.get('format') or 'jsonl'
+        return cleaned_data
@@ -0,0 +1,285 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+
+# Замеры одного запроса: SQL, кэш, шаблоны и общее время. Метрики текущего запроса лежат
+# в contextvar, поэтому обёртки SQL и кэша ничего не знают о запросе и не мешают вне него
+# (Celery, команды). Гистограммы копятся в памяти процесса: каждый воркер отдаёт свои.
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('sql_count', 'sql_time', 'cache_hits', 'cache_misses', 'cache_time', 'template_time')
+
+    def __init__(self):
+        self.sql_count = self.cache_hits = self.cache_misses = 0
+        self.sql_time = self.cache_time = self.template_time = 0.0
+
+    def server_timing(self, total):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="SQL x{self.sql_count}"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="hit {self.cache_hits} miss {self.cache_misses}"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ])
+
+
+def current_metrics():
+    return _current.get()
+
+
+@contextmanager
+def timer(kind):
+    """Добавляет время блока к template_time/sql_time/cache_time текущего запроса."""
+    metrics = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            attr = f'{kind}_time'
+            setattr(metrics, attr, getattr(metrics, attr) + time.perf_counter() - started)
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_count += 1
+        metrics.sql_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_sql_wrapper(sender, connection, **kwargs):
+    if sql_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_wrapper)
+
+
+def install_sql_wrappers():
+    # соединения, открытые до загрузки этого модуля, сигнал connection_created уже пропустили
+    for connection in connections.all(initialized_only=True):
+        install_sql_wrapper(None, connection)
+
+
+_MISS = object()
+
+
+class InstrumentedCacheMixin:
+    """Считает попадания, промахи и время обращений к кэшу в рамках запроса."""
+
+    def _timed(self, method, *args, **kwargs):
+        metrics = _current.get()
+        started = time.perf_counter()
+        result = method(*args, **kwargs)
+        if metrics is not None:
+            metrics.cache_time += time.perf_counter() - started
+        return result
+
+    def get(self, key, default=None, version=None):
+        value = self._timed(super().get, key, _MISS, version)
+        metrics = _current.get()
+        if metrics is not None:
+            if value is _MISS:
+                metrics.cache_misses += 1
+            else:
+                metrics.cache_hits += 1
+        return default if value is _MISS else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = self._timed(super().get_many, keys, version)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.cache_hits += len(found)
+            metrics.cache_misses += len(keys) - len(found)
+        return found
+
+    def set(self, *args, **kwargs):
+        return self._timed(super().set, *args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        return self._timed(super().add, *args, **kwargs)
+
+    def set_many(self, *args, **kwargs):
+        return self._timed(super().set_many, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._timed(super().delete, *args, **kwargs)
+
+
+class InstrumentedFileBasedCache(InstrumentedCacheMixin, FileBasedCache):
+    pass
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = {
+    'newsportal_request_duration_seconds': ('Время обработки запроса', SECONDS_BUCKETS),
+    'newsportal_db_duration_seconds': ('Время SQL-запросов за запрос', SECONDS_BUCKETS),
+    'newsportal_db_queries': ('Количество SQL-запросов за запрос', QUERY_BUCKETS),
+    'newsportal_cache_duration_seconds': ('Время обращений к кэшу за запрос', SECONDS_BUCKETS),
+    'newsportal_template_duration_seconds': ('Время отрисовки шаблонов за запрос', SECONDS_BUCKETS),
+}
+COUNTERS = {
+    'newsportal_cache_requests_total': 'Обращения к кэшу на чтение',
+}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = defaultdict(dict)  # имя -> {view: Histogram}
+        self.counters = defaultdict(lambda: defaultdict(int))  # имя -> {(view, result): n}
+
+    def record(self, view, total, metrics):
+        values = {
+            'newsportal_request_duration_seconds': total,
+            'newsportal_db_duration_seconds': metrics.sql_time,
+            'newsportal_db_queries': metrics.sql_count,
+            'newsportal_cache_duration_seconds': metrics.cache_time,
+            'newsportal_template_duration_seconds': metrics.template_time,
+        }
+        with self.lock:
+            for name, value in values.items():
+                histogram = self.histograms[name].get(view)
+                if histogram is None:
+                    histogram = self.histograms[name][view] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+            counter = self.counters['newsportal_cache_requests_total']
+            counter[(view, 'hit')] += metrics.cache_hits
+            counter[(view, 'miss')] += metrics.cache_misses
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        lines = []
+        with self.lock:
+            for name, (help_text, buckets) in HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{name}_bucket{{view="{view}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+            for name, help_text in COUNTERS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (view, result), value in sorted(self.counters[name].items()):
+                    lines.append(f'{name}{{view="{view}",result="{result}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.url_name or 'unnamed'
+
+
+class InstrumentationMiddleware:
+    """
+    Замеряет запрос целиком и отдаёт заголовок Server-Timing; гистограммы по имени URL
+    (post_list, some_news, search, ...) доступны в формате Prometheus на /metrics/.
+    Ставится первым в MIDDLEWARE, чтобы в замер попали все остальные middleware.
+    Под ASGI работает как async: contextvar с метриками переходит и в потоки sync_to_async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        install_sql_wrappers()
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        install_sql_wrappers()
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def finish(self, request, response, metrics, started):
+        total = time.perf_counter() - started
+        response['Server-Timing'] = metrics.server_timing(total)
+        view = view_label(request)
+        if view != 'metrics':
+            registry.record(view, total, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # шаблон рисуется после всех process_template_response, конец ловим post-render колбэком
+        metrics = _current.get()
+        if metrics is not None and not response.is_rendered:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.template_time += time.perf_counter() - started
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_allowed(request):
+    """DEBUG, адрес из METRICS_ALLOWED_IPS или верный токен METRICS_TOKEN в Authorization: Bearer."""
+    if settings.DEBUG or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    # метрики только для своих, остальным страницы будто нет
+    if not metrics_allowed(request):
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+
+
+def recipients(user_ids):
+    """(id, username, email) пользователей по списку id; пользователи без почты пропускаются."""
+    return list(User.objects.filter(pk__in=user_ids).exclude(email='').order_by('pk')
+                .values_list('pk', 'username', 'email'))
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def post_messages(post, recipients):
+    template = get_template('posts/post_for_subscribers.html')
+    link = f'{settings.SITE_URL}{post.get_absolute_url()}'
+    # в письмах, как и на страницах, заголовок и текст после цензуры
+    short_text = post.text_censored[:50]
+    for user_id, username, email in recipients:
+        message = EmailMultiAlternatives(
+            subject=post.title_censored,
+            body=f'Здравствуй, {username}. Новая статья в твоём любимом разделе! {short_text}\n\n'
+                 f'Ссылка на новый пост: {link}',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+        )
+        message.attach_alternative(template.render({'text': short_text, 'link': link, 'user': username}),
+                                   'text/html')
+        yield user_id, message
+
+
+def send_post_messages(post, recipients, connection=None, sent=None):
+    """
+    Отправляет персональные письма пачке подписчиков через одно SMTP-соединение.
+    Письма уходят по одному, и id получателя сразу добавляется в sent: если соединение
+    оборвётся посреди пачки, повторять нужно только тех, кого в sent нет.
+    """
+    connection = connection or get_connection()
+    count = 0
+    with connection:
+        for user_id, message in post_messages(post, recipients):
+            count += connection.send_messages([message])
+            if sent is not None:
+                sent.add(user_id)
+    return count
@@ -0,0 +1,36 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from NewsPortal.mailing import chunked, send_post_messages
+from NewsPortal.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Замеряет скорость сборки и отправки писем о новом посте: синтетические подписчики, '
+            'письма сериализуются и пишутся в /dev/null через console-бэкенд')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=100_000)
+        parser.add_argument('--chunk-size', type=int, default=settings.SUBSCRIBERS_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        post = Post.objects.order_by('-time_in').first() or Post(
+            pk=1, type='NW', title='Benchmark', text='Текст новости для замера рассылки' * 5)
+        recipients = ((i, f'user{i}', f'user{i}@example.com') for i in range(options['subscribers']))
+
+        with open(os.devnull, 'w') as devnull:
+            started = time.perf_counter()
+            sent = chunks = 0
+            for chunk in chunked(recipients, options['chunk_size']):
+                connection = get_connection('django.core.mail.backends.console.EmailBackend', stream=devnull)
+                sent += send_post_messages(post, chunk, connection=connection)
+                chunks += 1
+            elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Писем: {sent}, пачек: {chunks}, время: {elapsed:.1f} с, {sent / elapsed:.0f} писем/с'
+        ))
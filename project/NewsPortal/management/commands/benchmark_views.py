@@ -0,0 +1,74 @@
+import json
+import subprocess
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from NewsPortal.benchmark import ASYNC_CONCURRENCY, compare, dataset_info, run_async_benchmarks, run_benchmarks
+from NewsPortal.models import Post
+from project.celery import app as celery_app
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа и число запросов к базе горячих страниц (тестовый клиент) и фоновых задач '
+            'на наборе seed_benchmark_data и пишет результаты в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', nargs='*', help='названия сценариев')
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--compare', help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--max-regression', type=float, default=20.0,
+                            help='допустимое замедление p50 в процентах при --compare')
+        parser.add_argument('--async', dest='async_mode', action='store_true',
+                            help='страницы чтения через ASGI (AsyncClient) с одновременными запросами')
+        parser.add_argument('--concurrency', type=int, default=ASYNC_CONCURRENCY,
+                            help='одновременных запросов в режиме --async')
+
+    def handle(self, *args, **options):
+        if not Post.objects.filter(author__username__startswith='bench_').exists():
+            raise CommandError('Нет данных для замеров, сначала запустите seed_benchmark_data')
+
+        # почта в память, testserver в ALLOWED_HOSTS; задачи Celery выполняются на месте
+        setup_test_environment()
+        celery_app.conf.task_always_eager = True
+        started_at = datetime.now().astimezone().isoformat(timespec='seconds')
+        results = []
+        try:
+            if options['async_mode']:
+                rows = run_async_benchmarks(options['iterations'], only=options['only'],
+                                            concurrency=options['concurrency'])
+            else:
+                rows = run_benchmarks(options['iterations'], only=options['only'])
+            for row in rows:
+                results.append(row)
+                line = (f'{row["name"]:<24} p50 {row["p50_ms"]:>9.2f} мс  p95 {row["p95_ms"]:>9.2f} мс  '
+                        f'запросов {row["queries"]:>3}  {row["status_codes"]}')
+                if 'requests_per_second' in row:
+                    line += f'  {row["requests_per_second"]:.0f} запр/с'
+                self.stdout.write(line)
+        finally:
+            celery_app.conf.task_always_eager = False
+            teardown_test_environment()
+
+        report = {'started_at': started_at, 'revision': git_revision(), 'dataset': dataset_info(), 'results': results}
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты записаны в {options["output"]}'))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline:
+                regressions = compare(results, json.load(baseline)['results'], options['max_regression'])
+            for name, old_ms, new_ms, old_queries, new_queries in regressions:
+                self.stderr.write(f'{name}: p50 {old_ms:.2f} -> {new_ms:.2f} мс, запросов {old_queries} -> {new_queries}')
+            if regressions:
+                raise CommandError(f'Замедлились сценарии: {len(regressions)}')
@@ -1,22 +1,55 @@
+import sys
+import time
+
+from django.core.mail import mail_managers
 from django.core.management.base import BaseCommand, CommandError
+from NewsPortal.bulk import purge_posts, purge_stats, refresh_after_bulk_change
 from NewsPortal.models import Post, Category
 
 
 class Command(BaseCommand):
-    help = 'Подсказка вашей команды'
+    help = ('Удаляет все посты категории пачками по первичному ключу (короткие транзакции, без сигналов '
+            'на каждый пост) и отправляет менеджерам одно итоговое письмо')
 
     def add_arguments(self, parser):
         parser.add_argument('category', type=str)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='только посчитать, что будет удалено')
+        parser.add_argument('--yes', action='store_true', help='не спрашивать подтверждение (для cron)')
 
     def handle(self, *args, **options):
-        answer = input(f'Вы правда хотите удалить все статьи в категории {options["category"]}? yes/no')
-
-        if answer != 'yes':
-            self.stdout.write(self.style.ERROR('Отменено'))
-            return
         try:
             category = Category.objects.get(name=options['category'])
-            Post.objects.filter(category=category).delete()
-            self.stdout.write(self.style.SUCCESS(f'Succesfully deleted all news from category {category.name}')) # в случае неправильного подтверждения говорим, что в доступе отказано
-        except Post.DoesNotExist:
-            self.stdout.write(self.style.ERROR(f'Could not find category {category.name}'))
\ No newline at end of file
+        except Category.DoesNotExist:
+            raise CommandError(f'Could not find category {options["category"]}')
+        posts = Post.objects.filter(category=category)
+
+        stats = purge_stats(posts)
+        self.stdout.write(f'В категории {category.name}: постов {stats["posts"]}, '
+                          f'комментариев {stats["comments"]}, голосов {stats["votes"]}')
+        if options['dry_run'] or not stats['posts']:
+            return
+
+        if not options['yes']:
+            if not sys.stdin.isatty():
+                raise CommandError('Нет терминала для подтверждения, запустите с --yes')
+            answer = input(f'Вы правда хотите удалить все статьи в категории {options["category"]}? yes/no')
+            if answer != 'yes':
+                self.stdout.write(self.style.ERROR('Отменено'))
+                return
+
+        deleted = 0
+        author_ids, category_ids = set(), {category.pk}
+        started = time.perf_counter()
+        for count, batch_authors, batch_categories in purge_posts(posts, batch_size=options['batch_size']):
+            deleted += count
+            author_ids |= batch_authors
+            category_ids |= batch_categories
+            self.stdout.write(f'Удалено {deleted} из {stats["posts"]}, {deleted / (time.perf_counter() - started):.0f} постов/с')
+
+        refresh_after_bulk_change(author_ids=author_ids, category_ids=category_ids)
+        mail_managers(
+            subject=f'Удалены все посты категории {category.name}',
+            message=f'Удалено постов: {deleted}, комментариев: {stats["comments"]}, голосов: {stats["votes"]}.',
+        )
+        self.stdout.write(self.style.SUCCESS(f'Succesfully deleted all news from category {category.name}: {deleted}'))
@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from NewsPortal.export import EXPORT_CHUNK_SIZE, export_lines, export_queryset
+from NewsPortal.forms import ExportForm
+
+
+class Command(BaseCommand):
+    help = ('Потоковая выгрузка постов в JSON Lines или CSV (поля как у importposts) '
+            'за период и/или по категориям; память не зависит от числа постов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='файл .jsonl/.csv или - для stdout')
+        parser.add_argument('--since', help='с даты (ГГГГ-ММ-ДД), включительно')
+        parser.add_argument('--until', help='по дату (ГГГГ-ММ-ДД), включительно')
+        parser.add_argument('--category', nargs='+', default=[], help='id категорий')
+        parser.add_argument('--format', choices=['jsonl', 'csv'])
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        form = ExportForm({'since': options['since'], 'until': options['until'],
+                           'category': options['category'], 'format': file_format})
+        if not form.is_valid():
+            raise CommandError('; '.join(f'{field}: {" ".join(errors)}' for field, errors in form.errors.items()))
+        data = form.cleaned_data
+        queryset = export_queryset(data['since'], data['until'], data['category'])
+
+        stream = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        exported = 0
+        try:
+            for exported, line in enumerate(export_lines(file_format, queryset, options['chunk_size']), start=1):
+                stream.write(line)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        if path != '-':
+            if file_format == 'csv':
+                exported = max(exported - 1, 0)  # первая строка CSV — заголовок
+            self.stdout.write(self.style.SUCCESS(f'Выгружено постов: {exported} в {path}'))
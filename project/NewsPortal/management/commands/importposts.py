@@ -0,0 +1,90 @@
+import csv
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from NewsPortal.bulk import import_posts, refresh_after_bulk_change
+from NewsPortal.models import Post
+
+
+def read_jsonl(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(stream, separator):
+    # категории в CSV — одна колонка, названия через separator
+    reader = csv.DictReader(stream)
+    line = 1  # строка файла, с которой начинается разбираемая запись (запись может занимать несколько строк)
+    try:
+        if reader.fieldnames is None:
+            return
+        line = reader.line_num + 1
+        for row in reader:
+            row['categories'] = [name.strip() for name in (row.get('categories') or '').split(separator)
+                                 if name.strip()]
+            yield row
+            line = reader.line_num + 1
+    except csv.Error as exc:
+        raise CommandError(f'Неверный CSV в строке {line}: {exc}')
+
+
+class Command(BaseCommand):
+    help = ('Массовый импорт постов из JSON Lines или CSV (поля title, text, type, author, categories, '
+            'time_in, rating): потоковое чтение, bulk_create пачками, без сигналов на каждую строку')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='файл .jsonl/.csv или - для stdin')
+        parser.add_argument('--format', choices=['jsonl', 'csv'])
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--category-separator', default=';')
+        parser.add_argument('--create-authors', action='store_true', help='создавать неизвестных пользователей')
+        parser.add_argument('--create-categories', action='store_true', help='создавать неизвестные категории')
+        parser.add_argument('--max-errors', type=int, default=20, help='сколько пропущенных строк показать')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        rows = read_csv(stream, options['category_separator']) if file_format == 'csv' else read_jsonl(stream)
+
+        imported = skipped = 0
+        first_pk = last_pk = None
+        author_ids, category_ids = set(), set()
+        started = time.perf_counter()
+        try:
+            batches = import_posts(rows, batch_size=options['batch_size'],
+                                   create_authors=options['create_authors'],
+                                   create_categories=options['create_categories'])
+            for posts, batch_categories, errors in batches:
+                for line, reason in errors:
+                    if skipped < options['max_errors']:
+                        self.stderr.write(f'Строка {line} пропущена: {reason}')
+                    skipped += 1
+                if posts:
+                    first_pk = posts[0].pk if first_pk is None else first_pk
+                    last_pk = posts[-1].pk
+                    author_ids.update(post.author_id for post in posts if post.rating)
+                category_ids.update(batch_categories)
+                imported += len(posts)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'Импортировано: {imported}, пропущено: {skipped}, {imported / elapsed:.0f} постов/с')
+        except json.JSONDecodeError as exc:
+            raise CommandError(f'Неверная строка JSON после {imported + skipped} строк: {exc}')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        if imported:
+            self.stdout.write('Обновляем поисковый индекс, счётчики, рейтинги и кэш...')
+            refresh_after_bulk_change(author_ids=author_ids, category_ids=category_ids,
+                                      posts=Post.objects.filter(pk__gte=first_pk, pk__lte=last_pk))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: импортировано {imported}, пропущено {skipped}, время {elapsed:.1f} с, '
+            f'{imported / elapsed:.0f} постов/с'
+        ))
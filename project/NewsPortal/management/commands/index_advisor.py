@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from NewsPortal.explain import advise, hot_queries
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN горячих запросов (лента, фильтры, страница категории, лимит постов, рассылки): '
+            'какие индексы используются, какие таблицы читаются целиком и каких индексов нет в базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', help='только эти запросы (имена см. --list)')
+        parser.add_argument('--list', action='store_true', help='показать имена запросов и выйти')
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (PostgreSQL, запросы выполняются)')
+        parser.add_argument('--plans', action='store_true', help='печатать планы целиком')
+        parser.add_argument('--strict', action='store_true', help='ошибка, если какого-то индекса нет в базе')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for query in hot_queries():
+                self.stdout.write(f'{query.name}: {", ".join(query.indexes)}')
+            return
+
+        missing = set()
+        try:
+            for report in advise(only=options['only'], analyze=options['analyze']):
+                self.stdout.write(self.style.MIGRATE_HEADING(report.name))
+                self.stdout.write(f'  индексы: {", ".join(report.used_indexes) or "-"}')
+                if report.full_scans:
+                    self.stdout.write(self.style.WARNING(f'  полный проход: {", ".join(report.full_scans)}'))
+                if report.sorts:
+                    self.stdout.write(self.style.WARNING('  отдельная сортировка: ORDER BY не берётся из индекса'))
+                if report.missing_indexes:
+                    self.stdout.write(self.style.ERROR(f'  нет в базе: {", ".join(report.missing_indexes)}'))
+                    missing.update(report.missing_indexes)
+                if options['plans']:
+                    self.stdout.write('    ' + report.plan.replace('\n', '\n    '))
+        except NotImplementedError as exc:
+            raise CommandError(str(exc))
+
+        if missing:
+            message = f'Не хватает индексов: {", ".join(sorted(missing))}. Примените миграции NewsPortal (migrate).'
+            if options['strict']:
+                raise CommandError(message)
+            self.stdout.write(self.style.ERROR(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('Все рекомендованные индексы есть в базе. '
+                                                 'Полный проход по маленькой таблице — нормальный выбор планировщика.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from NewsPortal.search import is_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов (заголовок и текст на всех языках)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError('Полнотекстовый поиск доступен только на PostgreSQL')
+
+        total = 0
+        for count in rebuild_search_index(batch_size=options['batch_size']):
+            total += count
+            self.stdout.write(f'Проиндексировано постов: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Индекс перестроен, всего постов: {total}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from NewsPortal.censorship import dictionary, recensor_all
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает заголовки и тексты после цензуры (title_censored, text_censored) и выдержки '
+            'для списков (excerpt) у постов и комментариев по текущему словарю CensoredWord')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        dictionary.reset()
+        posts, comments = recensor_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Изменено постов: {posts}, комментариев: {comments}'))
@@ -0,0 +1,14 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from NewsPortal.models import Author
+from NewsPortal.views import TOP_AUTHORS_CACHE_KEY
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рейтинги всех авторов одним запросом'
+
+    def handle(self, *args, **options):
+        updated = Author.objects.recompute_rating()
+        cache.delete(TOP_AUTHORS_CACHE_KEY)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитаны рейтинги авторов: {updated}'))
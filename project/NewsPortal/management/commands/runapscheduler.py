@@ -2,41 +2,17 @@ import logging
 from django.conf import settings
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-from django.core.mail import EmailMultiAlternatives
 from django.core.management.base import BaseCommand
-from django.template.loader import render_to_string
 from django_apscheduler.jobstores import DjangoJobStore
 from django_apscheduler.models import DjangoJobExecution
-from django.utils import timezone
-from NewsPortal.models import Post, Category
+from NewsPortal.digest import send_weekly_digest
 
 logger = logging.getLogger(__name__)
 
 
-# наша задача по выводу текста на экран
+# еженедельная рассылка, та же реализация, что и у Celery-задачи weekly_post
 def my_job():
-    today = timezone.now()
-    day_week_ago = today - timezone.timedelta(days=7)
-    posts = Post.objects.filter(time_in__gte=day_week_ago)
-    categories = set(posts.values_list('category__name', flat=True))  # берем только имя
-    subscribers = set(
-        Category.objects.filter(name__in=categories).values_list('subscribe__email', flat=True))
-
-    html_content = render_to_string(
-        'posts/posts_created_last_week.html',
-        {
-            'link': f'http://127.0.0.1:8000',
-            'posts': posts,
-        }
-    )
-    msg = EmailMultiAlternatives(
-        subject="Новости за неделю",
-        body='',
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=subscribers,
-    )
-    msg.attach_alternative(html_content, 'text/html')
-    msg.send()
+    send_weekly_digest()
 
 
 # функция, которая будет удалять неактуальные задачи
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from NewsPortal.benchmark import DATASET_SIZES, flush_dataset, seed_dataset
+
+
+class Command(BaseCommand):
+    help = ('Создаёт детерминированный набор данных для замеров: посты, авторы, категории и подписчики '
+            'с неравномерной популярностью (все имена начинаются с bench_)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', choices=DATASET_SIZES, default='10k')
+        parser.add_argument('--posts', type=int, help='точное количество постов вместо --size')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--flush', action='store_true', help='сначала удалить прошлый набор')
+
+    def handle(self, *args, **options):
+        posts = options['posts'] or DATASET_SIZES[options['size']]
+        if posts <= 0:
+            raise CommandError('Количество постов должно быть больше нуля')
+        started = time.perf_counter()
+        if options['flush']:
+            flush_dataset(batch_size=options['batch_size'])
+            self.stdout.write('Прошлый набор удалён')
+        for progress in seed_dataset(posts, seed=options['seed'], batch_size=options['batch_size']):
+            self.stdout.write(f'{progress} ({time.perf_counter() - started:.1f} с)')
+        self.stdout.write(self.style.SUCCESS(f'Набор из {posts} постов готов за {time.perf_counter() - started:.1f} с'))
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# состав индекса на момент миграции (поле, словарь postgres, вес); дальше его ведёт NewsPortal.search
+SEARCH_FIELDS = (
+    ('title', 'russian', 'A'),
+    ('title_ru', 'russian', 'A'),
+    ('title_en_us', 'english', 'A'),
+    ('text', 'russian', 'B'),
+    ('text_ru', 'russian', 'B'),
+    ('text_en_us', 'english', 'B'),
+)
+
+
+def fill_search_vector(apps, schema_editor):
+    # для больших таблиц лучше manage.py rebuild_search_index, он идёт пачками
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    vector = None
+    for field, config, weight in SEARCH_FIELDS:
+        part = django.contrib.postgres.search.SearchVector(field, config=config, weight=weight)
+        vector = part if vector is None else vector + part
+    Post = apps.get_model('NewsPortal', 'Post')
+    Post.objects.update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0002_category_name_en_us_category_name_ru_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='post_search_vector_gin'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
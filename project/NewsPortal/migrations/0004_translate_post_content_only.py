@@ -0,0 +1,99 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:31
+
+from django.db import migrations
+from django.db.models import F
+
+
+def merge_translated_categories(apps, schema_editor):
+    # связи, сохранённые через переводимое поле category_<lang>, переносим в общую PostCategory
+    PostCategory = apps.get_model('NewsPortal', 'PostCategory')
+    existing = set(PostCategory.objects.values_list('post_id', 'category_id'))
+    missing = set()
+    for model_name in ('PostCategory_ru', 'PostCategory_en_us'):
+        model = apps.get_model('NewsPortal', model_name)
+        missing.update(set(model.objects.values_list('post_id', 'category_id')) - existing)
+    PostCategory.objects.bulk_create(
+        [PostCategory(post_id=post_id, category_id=category_id) for post_id, category_id in missing],
+        batch_size=1000,
+    )
+
+
+def split_translated_fields(apps, schema_editor):
+    # обратный ход: колонки и таблицы по языкам созданы заново пустыми, заполняем их общими значениями,
+    # как их заполнял modeltranslation до этой миграции
+    Post = apps.get_model('NewsPortal', 'Post')
+    PostCategory = apps.get_model('NewsPortal', 'PostCategory')
+    Post.objects.update(**{f'{field}_{lang}': F(field)
+                           for field in ('author', 'type', 'time_in', 'rating') for lang in ('ru', 'en_us')})
+    links = list(PostCategory.objects.values_list('post_id', 'category_id'))
+    for model_name in ('PostCategory_ru', 'PostCategory_en_us'):
+        model = apps.get_model('NewsPortal', model_name)
+        model.objects.bulk_create(
+            [model(post_id=post_id, category_id=category_id) for post_id, category_id in links],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0003_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_translated_categories, split_translated_fields),
+        migrations.RemoveField(
+            model_name='postcategory_ru',
+            name='category',
+        ),
+        migrations.RemoveField(
+            model_name='postcategory_ru',
+            name='post',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='author_en_us',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='author_ru',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='category_en_us',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='category_ru',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='rating_en_us',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='rating_ru',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='time_in_en_us',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='time_in_ru',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='type_en_us',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='type_ru',
+        ),
+        migrations.DeleteModel(
+            name='PostCategory_en_us',
+        ),
+        migrations.DeleteModel(
+            name='PostCategory_ru',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0004_translate_post_content_only'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='author',
+            index=models.Index(fields=['-user_rating'], name='author_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('NewsPortal', '0005_author_rating_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.SmallIntegerField()),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='NewsPortal.comment')),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='NewsPortal.post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.SmallIntegerField(choices=[(1, 'Нравится'), (-1, 'Не нравится')])),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='NewsPortal.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommentVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.SmallIntegerField(choices=[(1, 'Нравится'), (-1, 'Не нравится')])),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='NewsPortal.comment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postvote',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='unique_post_vote'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentvote',
+            constraint=models.UniqueConstraint(fields=('comment', 'user'), name='unique_comment_vote'),
+        ),
+    ]
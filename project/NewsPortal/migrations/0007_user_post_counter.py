@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:42
+
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('NewsPortal', 'Post')
+    UserPostCounter = apps.get_model('NewsPortal', 'UserPostCounter')
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.combine(today, time.min))
+    rows = (Post.objects.order_by().values('author_id')
+            .annotate(total=Count('pk'), day_count=Count('pk', filter=Q(time_in__gte=start,
+                                                                       time_in__lt=start + timedelta(days=1)))))
+    UserPostCounter.objects.bulk_create(
+        [UserPostCounter(user_id=row['author_id'], total=row['total'], day=today, day_count=row['day_count'])
+         for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('NewsPortal', '0006_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPostCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='post_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('day_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0007_user_post_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_id', models.IntegerField()),
+                ('kind', models.CharField(choices=[('created', 'Пост создан'), ('changed', 'Пост изменён'), ('deleted', 'Пост удалён')], max_length=7)),
+                ('title', models.CharField(max_length=255)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:52
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    Category = apps.get_model('NewsPortal', 'Category')
+    CategoryStats = apps.get_model('NewsPortal', 'CategoryStats')
+    rows = Category.objects.annotate(total=Count('postcategory'), latest=Max('postcategory__post__time_in'))
+    CategoryStats.objects.bulk_create(
+        [CategoryStats(category_id=row.pk, post_count=row.total, last_post_at=row.latest) for row in rows],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0008_outbox_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='NewsPortal.category')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('last_post_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
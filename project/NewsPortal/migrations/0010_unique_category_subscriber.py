@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:54
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    # до ограничения повторная подписка создавала ещё одну строку: оставляем самую раннюю
+    CategorySubscribe = apps.get_model('NewsPortal', 'CategorySubscribe')
+    duplicates = (CategorySubscribe.objects.values('category_id', 'subscriber_id')
+                  .annotate(first=Min('pk'), total=Count('pk')).filter(total__gt=1))
+    for row in duplicates:
+        (CategorySubscribe.objects.filter(category_id=row['category_id'], subscriber_id=row['subscriber_id'])
+         .exclude(pk=row['first']).delete())
+
+
+class Migration(migrations.Migration):
+    # удаление и ALTER TABLE в одной транзакции PostgreSQL не даёт сделать из-за отложенных проверок FK
+    atomic = False
+
+    dependencies = [
+        ('NewsPortal', '0009_category_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='categorysubscribe',
+            constraint=models.UniqueConstraint(fields=('category', 'subscriber'), name='unique_category_subscriber'),
+        ),
+    ]
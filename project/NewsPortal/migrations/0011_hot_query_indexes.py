@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:56
+
+from django.db import migrations, models
+
+
+INDEXES = [
+    ('post', models.Index(fields=['-time_in', '-id'], name='post_time_in_id_idx')),
+    ('post', models.Index(fields=['author', 'time_in'], name='post_author_time_idx')),
+    ('post', models.Index(fields=['rating'], name='post_rating_idx')),
+    ('postcategory', models.Index(fields=['category', 'post'], name='postcategory_category_post_idx')),
+]
+
+
+def add_indexes(apps, schema_editor):
+    # на PostgreSQL индексы строятся без блокировки записи в таблицы постов (CREATE INDEX CONCURRENTLY,
+    # поэтому миграция не атомарна), на остальных базах — обычным CREATE INDEX
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for model_name, index in INDEXES:
+        model = apps.get_model('NewsPortal', model_name)
+        if concurrently:
+            schema_editor.add_index(model, index, concurrently=True)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def remove_indexes(apps, schema_editor):
+    concurrently = schema_editor.connection.vendor == 'postgresql'
+    for model_name, index in reversed(INDEXES):
+        model = apps.get_model('NewsPortal', model_name)
+        if concurrently:
+            schema_editor.remove_index(model, index, concurrently=True)
+        else:
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('NewsPortal', '0010_unique_category_subscriber'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[migrations.AddIndex(model_name=model_name, index=index) for model_name, index in INDEXES],
+            database_operations=[migrations.RunPython(add_indexes, remove_indexes)],
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:00
+
+import re
+
+from django.db import migrations, models
+
+
+# слово, которое раньше было зашито в фильтре censor
+INITIAL_WORDS = ['образование']
+# шаблон, который NewsPortal.censorship.compile_words строит для INITIAL_WORDS: основа + любое окончание
+PATTERN = re.compile(r'\bобразован\w*', re.IGNORECASE)
+# (исходное поле, поле с цензурой) вместе с языковыми версиями modeltranslation
+CENSORED_FIELDS = {
+    'Post': [('title', 'title_censored'), ('title_ru', 'title_censored_ru'), ('title_en_us', 'title_censored_en_us'),
+             ('text', 'text_censored'), ('text_ru', 'text_censored_ru'), ('text_en_us', 'text_censored_en_us')],
+    'Comment': [('text', 'text_censored')],
+}
+
+
+def censor_text(text):
+    # первая буква слова остаётся, остальные заменяются на *
+    if not text:
+        return text
+    return PATTERN.sub(lambda match: match.group()[0] + '*' * (len(match.group()) - 1), text)
+
+
+def fill_censored(apps, schema_editor):
+    # для больших таблиц то же самое делает manage.py recensor
+    CensoredWord = apps.get_model('NewsPortal', 'CensoredWord')
+    CensoredWord.objects.bulk_create([CensoredWord(word=word) for word in INITIAL_WORDS])
+    for model_name, fields in CENSORED_FIELDS.items():
+        model = apps.get_model('NewsPortal', model_name)
+        targets = [target for source, target in fields]
+        batch = []
+        for obj in model.objects.order_by('pk').iterator(chunk_size=1000):
+            for source, target in fields:
+                setattr(obj, target, censor_text(getattr(obj, source)))
+            batch.append(obj)
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, targets)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, targets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CensoredWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(max_length=64, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='text_censored',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_censored',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_censored_en_us',
+            field=models.TextField(blank=True, default='', editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_censored_ru',
+            field=models.TextField(blank=True, default='', editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='title_censored',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='title_censored_en_us',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='title_censored_ru',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, null=True),
+        ),
+        migrations.RunPython(fill_censored, migrations.RunPython.noop),
+    ]
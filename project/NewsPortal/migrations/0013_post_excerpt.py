@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:03
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+# (текст с цензурой, выдержка) вместе с языковыми версиями modeltranslation
+EXCERPT_FIELDS = [('text_censored', 'excerpt'), ('text_censored_ru', 'excerpt_ru'),
+                  ('text_censored_en_us', 'excerpt_en_us')]
+
+
+def make_excerpt(text):
+    # как NewsPortal.models.make_excerpt на момент миграции: 15 слов, не длиннее 300 символов
+    if text is None:
+        return None
+    return Truncator(Truncator(text).words(15)).chars(300)
+
+
+def fill_excerpts(apps, schema_editor):
+    # для больших таблиц то же самое делает manage.py recensor
+    Post = apps.get_model('NewsPortal', 'Post')
+    targets = [target for source, target in EXCERPT_FIELDS]
+    batch = []
+    for post in Post.objects.order_by('pk').only('pk', *[source for source, target in EXCERPT_FIELDS]).iterator(chunk_size=1000):
+        for source, target in EXCERPT_FIELDS:
+            setattr(post, target, make_excerpt(getattr(post, source)))
+        batch.append(post)
+        if len(batch) == 1000:
+            Post.objects.bulk_update(batch, targets)
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, targets)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0012_censorship'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_en_us',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='excerpt_ru',
+            field=models.CharField(blank=True, default='', editable=False, max_length=300, null=True),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:07
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def updated_at_from_time_in(apps, schema_editor):
+    # до этой миграции посты после публикации не отслеживались: считаем их не изменёнными с тех пор
+    Post = apps.get_model('NewsPortal', 'Post')
+    Post.objects.update(updated_at=F('time_in'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('NewsPortal', '0013_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.RunPython(updated_at_from_time_in, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,21 @@
+from collections import Counter, namedtuple
 from datetime import *
-from django.core.cache import cache
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import Truncator
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic.edit import UpdateView
 from django.utils.translation import pgettext_lazy
 
+from .caching import invalidate_tags
+from .censorship import censor_text, censored_fields, dictionary, localized_pairs
+
 
 article = 'AR'
 news = 'NW'
@@ -17,28 +26,97 @@ TYPE = [
 ]
 
 
+class CensorshipMixin:
+    """Поля *_censored с цензурированными версиями censored_sources, считаются при сохранении."""
+    censored_sources = ()
+
+    @classmethod
+    def derived_fields(cls):
+        """Поля, которые apply_censorship пересчитывает из исходных."""
+        return [target for source, target in censored_fields(cls, cls.censored_sources)]
+
+    def apply_censorship(self):
+        # значения читаются и пишутся мимо дескрипторов modeltranslation: каждая колонка отдельно
+        pattern = dictionary.get_pattern()
+        changed = False
+        for source, target in censored_fields(type(self), self.censored_sources):
+            changed |= self._set_derived(target, censor_text(pattern, self.__dict__.get(source)))
+        return changed
+
+    def _set_derived(self, name, value):
+        if self.__dict__.get(name) == value:
+            return False
+        self.__dict__[name] = value
+        return True
+
+    def censor_before_save(self, kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.apply_censorship()
+            return
+        pairs = censored_fields(type(self), self.censored_sources)
+        if any(source in update_fields for source, target in pairs):
+            self.apply_censorship()
+            kwargs['update_fields'] = set(update_fields) | set(self.derived_fields())
+
+
+EXCERPT_WORDS = 15
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(text):
+    # то же, что truncatewords:15 в шаблонах, только один раз при сохранении
+    if text is None:
+        return None
+    return Truncator(Truncator(text).words(EXCERPT_WORDS)).chars(EXCERPT_LENGTH)
+
+
+def _sum_rating(queryset, group_by):
+    return Coalesce(Subquery(queryset.order_by().values(group_by).annotate(total=Sum('rating')).values('total')), 0)
+
+
+class AuthorQuerySet(models.QuerySet):
+    def add_rating(self, deltas):
+        """Атомарно прибавляет к рейтингу авторов дельты [(user_id, delta), ...] одним UPDATE."""
+        totals = Counter()
+        for user_id, delta in deltas:
+            if user_id is not None:
+                totals[user_id] += delta
+        totals = {user_id: delta for user_id, delta in totals.items() if delta}
+        if not totals:
+            return 0
+        return self.filter(users_id__in=totals).update(user_rating=F('user_rating') + Case(
+            *[When(users_id=user_id, then=Value(delta)) for user_id, delta in totals.items()],
+            default=Value(0),
+        ))
+
+    def recompute_rating(self):
+        """Пересчитывает user_rating всех авторов выборки одним UPDATE с подзапросами."""
+        return self.update(user_rating=(
+            _sum_rating(Post.objects.filter(author=OuterRef('users')), 'author') * 3 +
+            _sum_rating(Comment.objects.filter(user=OuterRef('users')), 'user') +
+            _sum_rating(Comment.objects.filter(post__author=OuterRef('users')), 'post__author')
+        ))
+
+
 class Author(models.Model):
     name = models.CharField(max_length=255)
     users = models.OneToOneField(User, on_delete=models.CASCADE)
     user_rating = models.IntegerField(default=0)
 
+    objects = AuthorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-user_rating'], name='author_rating_idx'),
+        ]
+
     def update_rating(self):
-        comment_rating = Comment.objects.filter(user_id=self.users.id).aggregate(models.Sum('rating'))['rating__sum']
-        posts_rating = Post.objects.filter(author_id=self).aggregate(models.Sum('rating'))
-        post_id = Post.objects.filter(author_id=self).values_list('id', flat=True)
-        rating_comment_to_posts = Comment.objects.filter(post_id__in=post_id).aggregate(models.Sum('rating'))[
-            'rating__sum']
-        self.user_rating = (int(posts_rating['rating__sum']) * 3) + int(comment_rating) + int(rating_comment_to_posts)
-        self.save()
+        Author.objects.filter(pk=self.pk).recompute_rating()
+        self.refresh_from_db(fields=['user_rating'])
 
     def can_create_post(self):
-        today = date.today()
-        post_count = Post.objects.filter(author=self, created_at__date=today).count()
-        max_posts_per_day = 3  # максимальное количество постов в день
-        if post_count < max_posts_per_day:
-            return True
-        else:
-            return False
+        return UserPostCounter.objects.counts(self.users_id).can_create
 
 
 class Category(models.Model):
@@ -57,6 +135,11 @@ class CategorySubscribe(models.Model):
     category = models.ForeignKey(Category, on_delete=models.PROTECT, verbose_name=pgettext_lazy('category', 'category'))
     subscriber = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name=pgettext_lazy('subscriber', 'subscriber'))
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'subscriber'], name='unique_category_subscriber'),
+        ]
+
 
 class Appointment(models.Model):
     date = models.DateField(
@@ -71,29 +154,75 @@ class Appointment(models.Model):
         return f'{self.client_name}: {self.message}'
 
 
-class Post(models.Model):
+class Post(CensorshipMixin, models.Model):
     author = models.ForeignKey(User, default=1, on_delete=models.SET_DEFAULT, verbose_name=pgettext_lazy('Author', 'Author'))
     type = models.CharField(max_length=7, choices=TYPE, verbose_name=pgettext_lazy('Type', 'Type'))
     time_in = models.DateTimeField(auto_now_add=True, verbose_name=pgettext_lazy('Time_in', 'Time_in'))
+    # версия страницы поста для ETag / Last-Modified: растёт при любом изменении того, что видно на странице
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
+    version = models.PositiveIntegerField(default=1, editable=False)
     category = models.ManyToManyField(Category, through='PostCategory', verbose_name=pgettext_lazy('Category', 'Category'))
     title = models.CharField(max_length=255, verbose_name=pgettext_lazy('Title', 'Title'))
     text = models.TextField(verbose_name=pgettext_lazy('Text', 'Text'))
     rating = models.IntegerField(default=0, verbose_name=pgettext_lazy('Rating', 'Rating'))
-
+    # tsvector по заголовку и тексту, заполняется в NewsPortal.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # заголовок и текст после цензуры, считаются в save() (см. NewsPortal.censorship)
+    title_censored = models.CharField(max_length=255, blank=True, default='', editable=False)
+    text_censored = models.TextField(blank=True, default='', editable=False)
+    # начало текста после цензуры для списков: им не нужно читать весь текст
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, default='', editable=False)
+
+    censored_sources = ('title', 'text')
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='post_search_vector_gin'),
+            # лента и курсорная пагинация: ORDER BY time_in DESC, id DESC
+            models.Index(fields=['-time_in', '-id'], name='post_time_in_id_idx'),
+            # посты автора и его посты за день
+            models.Index(fields=['author', 'time_in'], name='post_author_time_idx'),
+            models.Index(fields=['rating'], name='post_rating_idx'),
+        ]
+
+    # (автор, рейтинг) в том виде, в каком они лежат в базе: по автору save() переносит рейтинг поста при смене автора
+    _rating_state = (None, 0)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'author_id' in field_names and 'rating' in field_names:
+            instance._rating_state = (instance.author_id, instance.rating)
+        return instance
 
     def like(self):
-        self.rating += 1
-        self.save()
+        self.change_rating(1)
 
     def dislike(self):
-        self.rating -= 1
-        self.save()
+        self.change_rating(-1)
+
+    def change_rating(self, delta):
+        # атомарный UPDATE вместо save(): без гонок и без сигналов post_save
+        touch_posts(Post.objects.filter(pk=self.pk), rating=F('rating') + delta)
+        Author.objects.add_rating([(self.author_id, 3 * delta)])
+        self.rating += delta
+        self.version += 1
+        self._rating_state = (self.author_id, self.rating)
+        invalidate_tags(f'post:{self.pk}')
+
+    @classmethod
+    def derived_fields(cls):
+        return super().derived_fields() + [target for source, target in localized_pairs(cls, 'text_censored', 'excerpt')]
+
+    def apply_censorship(self):
+        # выдержка берётся из текста после цензуры, поэтому пересчитывается вместе с ним
+        changed = super().apply_censorship()
+        for source, target in localized_pairs(type(self), 'text_censored', 'excerpt'):
+            changed |= self._set_derived(target, make_excerpt(self.__dict__.get(source)))
+        return changed
 
     def preview(self):
-        text = self.text[:124]
-        if len(self.text) > 124:
-            text += '...'
-        return text
+        return self.excerpt
 
     def __str__(self):
         return f'{self.title.title()}: {self.text[:20]}'
@@ -106,29 +235,216 @@ class Post(models.Model):
         else:
             return reverse('/', args=[str(self.id)])
 
+    def _written_fields(self):
+        """Поля, которые записал бы полный save(): все загруженные, кроме первичного ключа."""
+        deferred = self.get_deferred_fields()
+        return [field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred]
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)  # сначала вызываем метод родителя, чтобы объект сохранился
-        cache.delete(f'post-{self.pk}')  # затем удаляем его из кэша, чтобы сбросить его
+        old_author_id = self._rating_state[0]
+        adding = self._state.adding
+        self.censor_before_save(kwargs)
+        if not adding:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None and not kwargs.get('force_insert'):
+                update_fields = self._written_fields()
+            if update_fields is not None:
+                # рейтинг меняется только голосами (change_rating, votes.flush_rating_deltas) через F('rating'):
+                # save() его не пишет, иначе правка поста затёрла бы уже перенесённые в базу голоса
+                kwargs['update_fields'] = (set(update_fields) | {'version', 'updated_at'}) - {'rating'}
+        # пост, рейтинги, счётчики и события outbox из сигналов post_save сохраняются вместе или никак
+        with transaction.atomic():
+            super().save(*args, **kwargs)  # сначала вызываем метод родителя, чтобы объект сохранился
+            if adding and self.rating:
+                Author.objects.add_rating([(self.author_id, 3 * self.rating)])
+            if old_author_id is not None and old_author_id != self.author_id:
+                # пост сменил автора: рейтинг поста (как он записан в базе) и комментариев к нему
+                # переезжает к новому автору, как и счётчики постов
+                self.rating = Post.objects.filter(pk=self.pk).values_list('rating', flat=True).get()
+                moved = 3 * self.rating + (self.comment_set.aggregate(total=Sum('rating'))['total'] or 0)
+                Author.objects.add_rating([(old_author_id, -moved), (self.author_id, moved)])
+                UserPostCounter.objects.decrement(old_author_id, self.time_in)
+                UserPostCounter.objects.increment(self.author_id, self.time_in)
+        self._rating_state = (self.author_id, self.rating)
+
+
+def touch_posts(queryset, **fields):
+    """UPDATE постов в обход save(), который сдвигает и их версию (заодно можно записать другие поля)."""
+    return queryset.update(version=F('version') + 1, updated_at=timezone.now(), **fields)
+
 
 class PostCategory(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
 
-
-class Comment(models.Model):
+    class Meta:
+        indexes = [
+            # страница категории: от категории к её постам без обращения к таблице
+            models.Index(fields=['category', 'post'], name='postcategory_category_post_idx'),
+        ]
+
+
+class CategoryStatsQuerySet(models.QuerySet):
+    def post_added(self, category_ids, time_in, count=1):
+        """count постов, последний из которых датирован time_in, добавлены в категории: один атомарный UPDATE."""
+        category_ids = list(category_ids)
+        if not category_ids:
+            return
+        self.bulk_create([CategoryStats(category_id=pk) for pk in category_ids], ignore_conflicts=True)
+        self.filter(category_id__in=category_ids).update(
+            post_count=F('post_count') + count,
+            last_post_at=Greatest(Coalesce(F('last_post_at'), Value(time_in)), Value(time_in)),
+        )
+
+    def post_removed(self, category_ids, time_in=None):
+        """Пост убран из категорий; дату последнего поста пересчитываем, только если убрали его самого."""
+        category_ids = list(category_ids)
+        if not category_ids:
+            return
+        stats = self.filter(category_id__in=category_ids)
+        stats.update(post_count=Greatest(F('post_count') - 1, 0))
+        if time_in is not None:
+            stats = stats.filter(last_post_at__lte=time_in)
+        stats.update(last_post_at=Subquery(
+            Post.objects.filter(postcategory__category_id=OuterRef('category_id'))
+            .order_by('-time_in').values('time_in')[:1]
+        ))
+
+    def rebuild(self):
+        """Пересчитывает счётчики всех категорий (после массовых операций в обход сигналов)."""
+        rows = Category.objects.annotate(total=Count('postcategory'), latest=Max('postcategory__post__time_in'))
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([CategoryStats(category_id=row.pk, post_count=row.total, last_post_at=row.latest)
+                              for row in rows.only('pk')], batch_size=1000)
+
+
+# Сколько постов в категории и когда вышел последний: список категорий рисуется одним запросом
+# с select_related('stats'). Обновляется сигналами PostCategory и m2m_changed
+class CategoryStats(models.Model):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    post_count = models.PositiveIntegerField(default=0)
+    last_post_at = models.DateTimeField(null=True, blank=True)
+
+    objects = CategoryStatsQuerySet.as_manager()
+
+
+class Comment(CensorshipMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
+    text_censored = models.TextField(blank=True, default='', editable=False)
     time_in = models.DateTimeField(auto_now_add=True)
     rating = models.IntegerField(default=0)
 
+    # (пост, рейтинг) в том виде, в каком они лежат в базе, см. Post._rating_state
+    _rating_state = (None, 0)
+    censored_sources = ('text',)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'post_id' in field_names and 'rating' in field_names:
+            instance._rating_state = (instance.post_id, instance.rating)
+        return instance
+
     def like(self):
-        self.rating += 1
-        self.save()
+        self.change_rating(1)
 
     def dislike(self):
-        self.rating -= 1
-        self.save()
+        self.change_rating(-1)
+
+    def change_rating(self, delta):
+        Comment.objects.filter(pk=self.pk).update(rating=F('rating') + delta)
+        Author.objects.add_rating([(self.user_id, delta), (self.post.author_id, delta)])
+        self.rating += delta
+        self._rating_state = (self.post_id, self.rating)
+
+    def save(self, *args, **kwargs):
+        old_post_id, old_rating = self._rating_state
+        self.censor_before_save(kwargs)
+        super().save(*args, **kwargs)
+        self._rating_state = (self.post_id, self.rating)
+        if self._rating_state != (old_post_id, old_rating):
+            # рейтинг комментария идёт и его автору, и автору поста
+            post_authors = dict(Post.objects.filter(pk__in=[old_post_id, self.post_id])
+                                .values_list('pk', 'author_id'))
+            Author.objects.add_rating([
+                (self.user_id, self.rating - old_rating),
+                (post_authors.get(old_post_id), -old_rating),
+                (post_authors.get(self.post_id), self.rating),
+            ])
+
+
+LIKE = 1
+DISLIKE = -1
+
+VOTE_CHOICES = [
+    (LIKE, 'Нравится'),
+    (DISLIKE, 'Не нравится'),
+]
+
+
+# Голоса пользователей: по одной строке на пару (пользователь, пост/комментарий)
+class PostVote(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='votes')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    value = models.SmallIntegerField(choices=VOTE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='unique_post_vote'),
+        ]
+
+
+class CommentVote(models.Model):
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='votes')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    value = models.SmallIntegerField(choices=VOTE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['comment', 'user'], name='unique_comment_vote'),
+        ]
+
+
+# Буфер ещё не применённых изменений рейтинга: голосование только дописывает сюда строки,
+# а NewsPortal.votes.flush_rating_deltas пачками переносит их в Post.rating и Comment.rating
+class RatingDelta(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
+    delta = models.SmallIntegerField()
+
+
+POST_CREATED = 'created'
+POST_CHANGED = 'changed'
+POST_DELETED = 'deleted'
+
+OUTBOX_KINDS = [
+    (POST_CREATED, 'Пост создан'),
+    (POST_CHANGED, 'Пост изменён'),
+    (POST_DELETED, 'Пост удалён'),
+]
+
+
+# Словарь цензуры: слова хранятся в начальной форме, формы слова и регистр учитываются при проверке
+class CensoredWord(models.Model):
+    word = models.CharField(max_length=64, unique=True)
+
+    def __str__(self):
+        return self.word
+
+
+# Transactional outbox: сигналы поста пишут сюда строку в той же транзакции,
+# а письма менеджерам рассылает NewsPortal.outbox.dispatch_outbox из фоновой задачи
+class OutboxEvent(models.Model):
+    post_id = models.IntegerField()  # не ForeignKey: событие об удалении переживает сам пост
+    kind = models.CharField(max_length=7, choices=OUTBOX_KINDS)
+    title = models.CharField(max_length=255)
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
 
 class ArticleUpdateView(LoginRequiredMixin, UpdateView):
@@ -143,3 +459,71 @@ class ArticleUpdateView(LoginRequiredMixin, UpdateView):
 class DailyPostLimit(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     limit = models.PositiveIntegerField(default=3)
+
+
+DEFAULT_DAILY_POST_LIMIT = 3
+
+PostCounts = namedtuple('PostCounts', ['total', 'today', 'limit'])
+PostCounts.can_create = property(lambda counts: counts.today < counts.limit)
+
+
+def _day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+class UserPostCounterQuerySet(models.QuerySet):
+    def increment(self, user_id, time_in, step=1):
+        """Атомарно учитывает пост пользователя, созданный в time_in (step=-1 — удалённый)."""
+        day = timezone.localdate(time_in)
+        self.get_or_create(user_id=user_id, defaults={'day': day})
+        # в UPDATE все выражения видят старые значения строки, так что день сравнивается до его замены
+        if day >= timezone.localdate():
+            return self.filter(user_id=user_id).update(
+                total=Greatest(F('total') + step, 0),
+                day_count=Case(When(day=day, then=Greatest(F('day_count') + step, 0)), default=Value(max(step, 0))),
+                day=day,
+            )
+        # пост за прошлые дни: счётчик текущего дня не трогаем
+        return self.filter(user_id=user_id).update(total=Greatest(F('total') + step, 0))
+
+    def decrement(self, user_id, time_in):
+        return self.increment(user_id, time_in, step=-1)
+
+    def counts(self, user_id, lock=False):
+        """Счётчики и дневной лимит пользователя одним запросом по первичному ключу."""
+        users = User.objects.filter(pk=user_id)
+        if lock:
+            # блокируем строку пользователя: параллельные создания постов проверяют лимит по очереди
+            users = users.select_for_update(of=('self',))
+        row = users.values('post_counter__total', 'post_counter__day', 'post_counter__day_count',
+                           'dailypostlimit__limit').first() or {}
+        today = row.get('post_counter__day_count') or 0
+        if row.get('post_counter__day') != timezone.localdate():
+            today = 0
+        limit = row.get('dailypostlimit__limit')
+        return PostCounts(row.get('post_counter__total') or 0, today,
+                          DEFAULT_DAILY_POST_LIMIT if limit is None else limit)
+
+    def rebuild(self):
+        """Пересчитывает все счётчики по таблице постов (после массовых операций в обход сигналов)."""
+        today = timezone.localdate()
+        start, end = _day_bounds(today)
+        rows = (Post.objects.order_by().values('author_id')
+                .annotate(total=Count('pk'), day_count=Count('pk', filter=Q(time_in__gte=start, time_in__lt=end))))
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create([UserPostCounter(user_id=row['author_id'], total=row['total'],
+                                              day=today, day_count=row['day_count']) for row in rows],
+                             batch_size=1000)
+
+
+# Сколько постов у пользователя всего и за текущий день (по TIME_ZONE проекта).
+# Обновляется сигналами при создании и удалении поста, чтобы не считать посты COUNT-ом на каждой странице
+class UserPostCounter(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='post_counter')
+    total = models.PositiveIntegerField(default=0)
+    day = models.DateField()
+    day_count = models.PositiveIntegerField(default=0)
+
+    objects = UserPostCounterQuerySet.as_manager()
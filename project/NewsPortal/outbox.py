@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.mail import mail_managers
+from django.db import transaction
+
+from .models import POST_CHANGED, POST_CREATED, POST_DELETED, OutboxEvent
+
+
+def record_post_event(kind, post):
+    """Добавляет событие в outbox; вызывается из сигналов, т.е. в транзакции сохранения поста."""
+    return OutboxEvent.objects.create(post_id=post.pk, kind=kind, title=post.title, text=post.text)
+
+
+def merge_events(events):
+    """
+    Сворачивает события по постам: [(post_id, kind, title, text), ...] в порядке появления
+    -> {post_id: (kind, title, text, edits)}. Заголовок и текст берутся из последнего события,
+    созданный и затем изменённый пост остаётся созданным, удаление перекрывает всё остальное.
+    """
+    merged = {}
+    for post_id, kind, title, text in events:
+        if post_id not in merged:
+            merged[post_id] = (kind, title, text, int(kind == POST_CHANGED))
+            continue
+        first_kind, _, _, edits = merged[post_id]
+        if kind == POST_DELETED:
+            first_kind = POST_DELETED
+        elif kind == POST_CHANGED:
+            edits += 1
+        merged[post_id] = (first_kind, title, text, edits)
+    return merged
+
+
+def digest_message(merged):
+    sections = {POST_CREATED: [], POST_CHANGED: [], POST_DELETED: []}
+    for kind, title, text, edits in merged.values():
+        if kind == POST_CHANGED and edits > 1:
+            sections[kind].append(f'- {title} (изменений: {edits})\n  {text[:200]}')
+        elif kind == POST_DELETED:
+            sections[kind].append(f'- Пост с названием "{title}" был удален')
+        else:
+            sections[kind].append(f'- {title}\n  {text[:200]}')
+    headers = {POST_CREATED: 'Новые посты:', POST_CHANGED: 'Измененные посты:', POST_DELETED: 'Удаленные посты:'}
+    return '\n\n'.join('\n'.join([headers[kind]] + lines) for kind, lines in sections.items() if lines)
+
+
+def dispatch_outbox(batch_size=None):
+    """
+    Отправляет менеджерам одну сводку по накопившимся событиям (не больше batch_size)
+    и удаляет их из outbox. Письмо уходит до коммита: если отправка упала,
+    события остаются и попадут в следующую сводку.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        batch = list(OutboxEvent.objects.select_for_update(skip_locked=True).order_by('pk')
+                     .values_list('pk', 'post_id', 'kind', 'title', 'text')[:batch_size])
+        if not batch:
+            return 0
+        merged = merge_events(row[1:] for row in batch)
+        mail_managers(
+            subject=f'Изменения постов на портале: {len(merged)}',
+            message=digest_message(merged),
+        )
+        OutboxEvent.objects.filter(pk__in=[row[0] for row in batch]).delete()
+    return len(batch)
@@ -0,0 +1,172 @@
+import base64
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, time_in, pk):
+    raw = f'{direction}|{time_in.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, time_in, pk = raw.split('|')
+        if direction not in ('n', 'p'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(time_in), int(pk)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def estimate_count(queryset):
+    """Оценка количества строк по плану запроса PostgreSQL вместо полного COUNT(*)."""
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по ключу (time_in, id) вместо OFFSET: каждая страница
+    читается по индексу с того места, где закончилась предыдущая, поэтому
+    глубокие страницы стоят столько же, сколько первая.
+
+    count_mode: 'none' — без подсчёта, 'estimate' — оценка планировщика, 'exact' — COUNT(*).
+    count — уже известное количество (например, из счётчика), тогда база не спрашивается.
+    key(row) -> (time_in, pk) для строк без таких атрибутов (например, словарей values()).
+    transform(rows) -> объекты страницы: вызывается с уже прочитанными строками страницы
+    (например, rows.post_rows, который добирает категории одним запросом).
+    """
+    def __init__(self, queryset, per_page, count_mode='none', count=None, key=None, transform=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.count_mode = count_mode if count is None else 'exact'
+        self._count = count
+        self.key = key or (lambda row: (row.time_in, row.pk))
+        self.transform = transform
+
+    @property
+    def count(self):
+        if self.count_mode == 'none':
+            return None
+        if self._count is None:
+            queryset = self.queryset.order_by()
+            self._count = estimate_count(queryset) if self.count_mode == 'estimate' else queryset.count()
+        return self._count
+
+    async def acount(self):
+        if self.count_mode == 'none':
+            return None
+        if self._count is None:
+            queryset = self.queryset.order_by()
+            if self.count_mode == 'estimate':
+                self._count = await sync_to_async(estimate_count)(queryset)
+            else:
+                self._count = await queryset.acount()
+        return self._count
+
+    def _window(self, cursor):
+        """Запрос страницы (на одну строку больше, чтобы узнать, есть ли следующая) и направление курсора."""
+        queryset = self.queryset
+        direction = None
+        if cursor:
+            direction, time_in, pk = decode_cursor(cursor)
+            if direction == 'n':
+                queryset = queryset.filter(Q(time_in__lt=time_in) | Q(time_in=time_in, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(time_in__gt=time_in) | Q(time_in=time_in, id__gt=pk))
+        if direction == 'p':
+            return queryset.order_by('time_in', 'id')[:self.per_page + 1], direction
+        return queryset.order_by('-time_in', '-id')[:self.per_page + 1], direction
+
+    def _page(self, rows, direction):
+        has_more = len(rows) > self.per_page
+        if direction == 'p':
+            rows = rows[:self.per_page][::-1]
+            has_next, has_previous = True, has_more
+        else:
+            rows = rows[:self.per_page]
+            has_next, has_previous = has_more, direction == 'n'
+        if self.transform is not None:
+            rows = self.transform(rows)
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor('n', *self.key(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor('p', *self.key(rows[0]))
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        queryset, direction = self._window(cursor)
+        return self._page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        queryset, direction = self._window(cursor)
+        rows = [row async for row in queryset]
+        if self.transform is not None:
+            # transform может читать базу
+            return await sync_to_async(self._page)(rows, direction)
+        return self._page(rows, direction)
+
+
+def paginate_by_cursor(request, queryset, per_page, count_mode='none', cursor_kwarg='cursor', count=None,
+                       transform=None):
+    paginator = KeysetPaginator(queryset, per_page, count_mode=count_mode, count=count, transform=transform)
+    try:
+        page = paginator.page(request.GET.get(cursor_kwarg))
+    except InvalidCursor:
+        raise Http404('Неверный курсор страницы')
+    return paginator, page
+
+
+class KeysetPaginationMixin:
+    """Подменяет OFFSET-пагинацию ListView на KeysetPaginator, параметр ?cursor=..."""
+    cursor_kwarg = 'cursor'
+    count_mode = 'estimate'
+    page_transform = None  # см. KeysetPaginator.transform
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page = paginate_by_cursor(self.request, queryset, page_size, count_mode=self.count_mode,
+                                             cursor_kwarg=self.cursor_kwarg, transform=self.page_transform)
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,71 @@
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _budget_message(label, limit, queries):
+    lines = [f'{label}: {len(queries)} запросов к базе при бюджете {limit}']
+    lines += [f'{number}. {query["sql"]}' for number, query in enumerate(queries, start=1)]
+    return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(limit, using=DEFAULT_DB_ALIAS, label='Блок кода'):
+    """
+    Падает с QueryBudgetExceeded, если внутри блока выполнено больше limit запросов.
+
+        with query_budget(5):
+            client.get('/news/')
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    if len(context) > limit:
+        raise QueryBudgetExceeded(_budget_message(label, limit, context.captured_queries))
+
+
+def assert_max_queries(limit, func, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Вызывает func(*args, **kwargs) в пределах бюджета запросов и возвращает результат."""
+    with query_budget(limit, using=using, label=getattr(func, '__qualname__', repr(func))):
+        return func(*args, **kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Бюджет запросов для представления: при DEBUG = True пишет предупреждение в лог,
+    если страница (вместе с отрисовкой шаблона) сделала больше query_budget запросов.
+    """
+    query_budget = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not settings.DEBUG or self.query_budget is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        context = CaptureQueriesContext(connections[DEFAULT_DB_ALIAS])
+        context.__enter__()
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            context.__exit__(None, None, None)
+            raise
+
+        def check(response):
+            context.__exit__(None, None, None)
+            if len(context) > self.query_budget:
+                logger.warning(_budget_message(f'{type(self).__name__} {request.path}',
+                                               self.query_budget, context.captured_queries))
+
+        # запросы из шаблона выполняются при отрисовке, поэтому считаем до её конца
+        if getattr(response, 'is_rendered', True):
+            check(response)
+        else:
+            response.add_post_render_callback(check)
+        return response
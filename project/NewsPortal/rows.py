@@ -0,0 +1,53 @@
+from collections import defaultdict
+
+from django.urls import reverse
+
+from .models import Category, article
+
+
+# Списки постов (лента, категория, посты за неделю) показывают заголовок, дату, тип, автора,
+# категории и выдержку. Вместо моделей с полным текстом — values() и объекты с __slots__:
+# post_values() даёт queryset, который можно фильтровать и резать на страницы, а post_rows()
+# превращает уже прочитанную страницу в PostRow (у KeysetPaginator это параметр transform).
+
+ROW_FIELDS = ('pk', 'time_in', 'type', 'title_censored', 'excerpt', 'author__username')
+
+
+class PostRow:
+    __slots__ = ('pk', 'time_in', 'type', 'title', 'excerpt', 'author_name', 'categories')
+
+    def __init__(self, values):
+        self.pk = values['pk']
+        self.time_in = values['time_in']
+        self.type = values['type']
+        self.title = values['title_censored']
+        self.excerpt = values['excerpt']
+        self.author_name = values['author__username']
+        self.categories = []
+
+    def __repr__(self):
+        return f'<PostRow {self.pk}>'
+
+    def get_absolute_url(self):
+        return reverse('article' if self.type == article else 'some_news', args=[self.pk])
+
+
+def post_values(queryset):
+    """Queryset строк списка: values() только нужных колонок, без поля text (языковые версии подставит modeltranslation)."""
+    return queryset.values(*ROW_FIELDS)
+
+
+def post_rows(values):
+    """Строки post_values() (уже срезанные до страницы) -> [PostRow]; категории всех строк одним запросом."""
+    rows = [PostRow(row) for row in values]
+    if rows:
+        by_post = defaultdict(list)
+        names = (Category.objects
+                 .filter(postcategory__post_id__in=[row.pk for row in rows])
+                 .order_by('pk')
+                 .values_list('postcategory__post_id', 'name'))
+        for post_id, name in names:
+            by_post[post_id].append(name)
+        for row in rows:
+            row.categories = by_post[row.pk]
+    return rows
@@ -0,0 +1,81 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q
+
+from .models import Post, PostCategory
+
+
+# Что попадает в поисковый индекс: (поле, словарь postgres, вес).
+# Заголовок весит больше текста. Словарь russian стеммит и кириллицу, и латиницу,
+# английские копии modeltranslation дополнительно прогоняем через english.
+SEARCH_FIELDS = (
+    ('title', 'russian', 'A'),
+    ('title_ru', 'russian', 'A'),
+    ('title_en_us', 'english', 'A'),
+    ('text', 'russian', 'B'),
+    ('text_ru', 'russian', 'B'),
+    ('text_en_us', 'english', 'B'),
+)
+
+INDEXED_FIELDS = frozenset(field for field, config, weight in SEARCH_FIELDS)
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    vector = None
+    for field, config, weight in SEARCH_FIELDS:
+        part = SearchVector(field, config=config, weight=weight)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def search_query(text):
+    return (SearchQuery(text, config='russian', search_type='websearch') |
+            SearchQuery(text, config='english', search_type='websearch'))
+
+
+def update_search_index(*pks):
+    """Пересчитывает поисковый вектор для указанных постов одним UPDATE."""
+    if not pks or not is_supported():
+        return 0
+    return Post.objects.filter(pk__in=pks).update(search_vector=search_vector())
+
+
+def rebuild_search_index(batch_size=5000, queryset=None):
+    """Перестраивает индекс пачками по первичному ключу, отдавая количество обработанных строк."""
+    if not is_supported():
+        return
+    queryset = (queryset if queryset is not None else Post.objects.all()).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        Post.objects.filter(pk__gte=pks[0], pk__lte=pks[-1]).update(search_vector=search_vector())
+        last_pk = pks[-1]
+        yield len(pks)
+
+
+def search_posts(text, category_id=None):
+    """Посты, подходящие под запрос, отсортированные по релевантности."""
+    queryset = Post.objects.all()
+    if category_id:
+        queryset = queryset.filter(
+            Exists(PostCategory.objects.filter(post=OuterRef('pk'), category_id=category_id))
+        )
+    text = (text or '').strip()
+    if not text:
+        return queryset.order_by('-time_in')
+
+    if not is_supported():
+        # sqlite и прочие базы без tsvector: простой поиск по подстроке
+        return queryset.filter(Q(title__icontains=text) | Q(text__icontains=text)).order_by('-time_in')
+
+    query = search_query(text)
+    return (queryset
+            .filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-time_in'))
@@ -1,50 +1,196 @@
-from django.core.mail import mail_managers, EmailMultiAlternatives
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from django.template.loader import render_to_string
 
-from .models import Post
+from .caching import invalidate_post, invalidate_tags
+from .censorship import dictionary
+from .models import (POST_CHANGED, POST_CREATED, POST_DELETED, Author, Category, CategoryStats, CategorySubscribe,
+                     CensoredWord, Comment, Post, PostCategory, UserPostCounter, touch_posts)
+from .outbox import record_post_event
+from .search import INDEXED_FIELDS, update_search_index
+from .subscriptions import invalidate_subscribers
 
 
-def post_for_subscribers(subscriber, title, short_text, subscribers, pk):
-    html_content = render_to_string('posts/post_for_subscribers.html',
-                                    {'text': short_text,
-                                     "link": f'http://127.0.0.1:8000/post/{pk}',
-                                     "user": subscriber})
-    # for n in subscribers_email:
-    message = EmailMultiAlternatives(
-        subject=title,
-        body='',
-        from_email='kissodessa@gmail.com',
-        to=subscribers
-    )
-    message.attach_alternative(html_content, "text/html")  # добавляем htm
-    message.send()
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    # строку индекса обновляем только если менялся заголовок или текст
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    update_search_index(instance.pk)
 
 
+# Письма менеджерам не отправляются из сигналов: в той же транзакции пишем событие в outbox,
+# сводку рассылает задача dispatch_outbox (NewsPortal.outbox)
 @receiver(post_save, sender=Post)
 def notify_managers(sender, instance, created, **kwargs):
+    record_post_event(POST_CREATED if created else POST_CHANGED, instance)
+
+
+@receiver(post_delete, sender=Post)
+def notify_managers_post_deleted(sender, instance, **kwargs):
+    record_post_event(POST_DELETED, instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_rating(sender, instance, **kwargs):
+    Author.objects.add_rating([(instance.author_id, -3 * instance.rating)])
+
+
+@receiver(post_save, sender=Post)
+def count_created_post(sender, instance, created, **kwargs):
     if created:
-        subject = f'{instance.title}'
-    else:
-        subject = f'Пост был изменен{instance.title} {instance.text}'
+        UserPostCounter.objects.increment(instance.author_id, instance.time_in)
 
-    mail_managers(
-        subject=subject,
-        message=instance.text,
-    )
-    print(f'{instance.title}')
 
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    UserPostCounter.objects.decrement(instance.author_id, instance.time_in)
 
-post_save.connect(notify_managers, sender=Post)
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_rating(sender, instance, **kwargs):
+    # при каскадном удалении поста комментарии удаляются раньше него, так что пост ещё на месте
+    post_author_id = Post.objects.filter(pk=instance.post_id).values_list('author_id', flat=True).first()
+    Author.objects.add_rating([(instance.user_id, -instance.rating), (post_author_id, -instance.rating)])
+
+
+# Сброс кэша: одна инвалидация на изменение, см. NewsPortal.caching
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, **kwargs):
+    invalidate_post(instance.pk, instance.author_id)
 
 
 @receiver(post_delete, sender=Post)
-def notify_managers_post_deleted(sender, instance, **kwargs):
-    subject = f'Пост с названием "{instance.title}" был удален'
-    mail_managers(
-        subject=subject,
-        message=f'Текст: {instance.text} ',
-    )
+def invalidate_deleted_post(sender, instance, **kwargs):
+    # связи с категориями к этому моменту уже удалены и сбросили свои теги сами
+    invalidate_post(instance.pk, instance.author_id, category_ids=())
+
+
+@receiver(post_save, sender=PostCategory)
+@receiver(post_delete, sender=PostCategory)
+def invalidate_post_category(sender, instance, **kwargs):
+    invalidate_tags('posts', 'categories', f'post:{instance.post_id}', f'category:{instance.category_id}')
+    touch_posts(Post.objects.filter(pk=instance.post_id))
+
+
+@receiver(m2m_changed, sender=Post.category.through)
+def invalidate_post_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if action == 'pre_clear':
+        field = 'category_id' if not reverse else 'post_id'
+        lookup = {'post_id': instance.pk} if not reverse else {'category_id': instance.pk}
+        pk_set = set(PostCategory.objects.filter(**lookup).values_list(field, flat=True))
+    if reverse:
+        tags = [f'category:{instance.pk}'] + [f'post:{pk}' for pk in pk_set or ()]
+    else:
+        tags = [f'post:{instance.pk}'] + [f'category:{pk}' for pk in pk_set or ()]
+    invalidate_tags('posts', 'categories', *tags)
+    # категории видны на странице поста
+    touch_posts(Post.objects.filter(pk__in=pk_set or ()) if reverse else Post.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, created=False, **kwargs):
+    tags = [f'category:{instance.pk}']
+    if not created:
+        # в строках постов видны все их категории: страницы категорий с общими постами тоже устарели
+        tags += [f'category:{pk}' for pk in shared_category_ids(instance.pk)]
+    invalidate_tags('posts', 'categories', *tags)
+
+
+def shared_category_ids(category_id):
+    """Категории, у которых есть общие посты с категорией category_id."""
+    posts = PostCategory.objects.filter(category_id=category_id).values('post_id')
+    return set(PostCategory.objects.filter(post_id__in=posts).exclude(category_id=category_id)
+               .values_list('category_id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def touch_category_posts(sender, instance, created, **kwargs):
+    # название категории есть на страницах её постов; переименования редки, так что UPDATE по всем постам допустим
+    if not created:
+        touch_posts(Post.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, update_fields=None, **kwargs):
+    # вход на сайт сохраняет только last_login, на страницах он не виден
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    if kwargs.get('created'):
+        invalidate_tags(f'author:{instance.pk}')
+        return
+    # имя автора есть в списках постов, на страницах его категорий и в лентах
+    category_ids = set(PostCategory.objects.filter(post__author=instance).values_list('category_id', flat=True))
+    invalidate_tags('posts', f'author:{instance.pk}', *[f'category:{pk}' for pk in category_ids])
+    touch_posts(Post.objects.filter(author=instance))
+
+
+# Счётчики категорий (CategoryStats). post.category.add() пишет связи bulk_create-ом без post_save,
+# поэтому добавление ловим и через m2m_changed; удаление связей всегда идёт через post_delete
+@receiver(post_save, sender=Category)
+def create_category_stats(sender, instance, created, **kwargs):
+    if created:
+        CategoryStats.objects.get_or_create(category=instance)
+
+
+@receiver(post_save, sender=PostCategory)
+def count_post_category(sender, instance, created, **kwargs):
+    if created:
+        time_in = Post.objects.filter(pk=instance.post_id).values_list('time_in', flat=True).first()
+        CategoryStats.objects.post_added([instance.category_id], time_in)
+
+
+@receiver(post_delete, sender=PostCategory)
+def uncount_post_category(sender, instance, **kwargs):
+    # None, если пост уже удалён: тогда дата последнего поста пересчитывается в любом случае
+    time_in = Post.objects.filter(pk=instance.post_id).values_list('time_in', flat=True).first()
+    CategoryStats.objects.post_removed([instance.category_id], time_in)
+
+
+@receiver(m2m_changed, sender=Post.category.through)
+def count_added_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        latest = Post.objects.filter(pk__in=pk_set).aggregate(latest=Max('time_in'))['latest']
+        CategoryStats.objects.post_added([instance.pk], latest, count=len(pk_set))
+    else:
+        CategoryStats.objects.post_added(pk_set, instance.time_in)
+
+
+# Индекс подписчиков (subscriptions.py). Массовые subscribe()/unsubscribe() сбрасывают его сами,
+# здесь — одиночные подписки из админки, shell и category.subscribe.add()/remove()
+@receiver(post_save, sender=CategorySubscribe)
+@receiver(post_delete, sender=CategorySubscribe)
+def invalidate_category_subscribers(sender, instance, **kwargs):
+    invalidate_subscribers([instance.category_id])
+
+
+@receiver(m2m_changed, sender=Category.subscribe.through)
+def invalidate_changed_subscribers(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_subscribers([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_subscribers(CategorySubscribe.objects.filter(subscriber=instance).values_list('category_id', flat=True))
+    else:
+        invalidate_subscribers(pk_set or ())
+
+
+# Словарь цензуры изменился: процессы перечитывают его, а сохранённые версии постов
+# и комментариев пересчитываются в фоне (или вручную: manage.py recensor)
+@receiver(post_save, sender=CensoredWord)
+@receiver(post_delete, sender=CensoredWord)
+def reload_censored_words(sender, instance, **kwargs):
+    from .tasks import recensor_posts
 
-    print(subject)
+    def changed():
+        dictionary.reset()
+        recensor_posts.delay()
+    transaction.on_commit(changed)
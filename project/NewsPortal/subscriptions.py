@@ -0,0 +1,93 @@
+from array import array
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .bulk import delete_rows
+from .caching import invalidate_tags, tag_versions
+from .mailing import chunked
+from .models import CategorySubscribe
+
+
+# Индекс подписчиков: для каждой категории в кэше лежит отсортированный массив id пользователей
+# (array('I'), 4 байта на подписчика). В ключ входит версия тега subscribers:<id>, поэтому подписка
+# и отписка просто сбрасывают тег, а массив перечитывается из базы при следующем обращении.
+# Версия берётся до запроса к базе, и тег сбрасывается после коммита: массив, прочитанный
+# до изменения, может лечь только под старую версию и больше не найдётся.
+INDEX_TIMEOUT = 60 * 60 * 24
+
+
+def _tag(category_id):
+    return f'subscribers:{category_id}'
+
+
+def _unpack(data):
+    ids = array('I')
+    ids.frombytes(data)
+    return ids
+
+
+def load_index(category_ids):
+    """{category_id: array('I') id подписчиков по возрастанию} одним запросом к базе."""
+    index = {pk: array('I') for pk in category_ids}
+    rows = (CategorySubscribe.objects
+            .filter(category_id__in=index)
+            .order_by('category_id', 'subscriber_id')
+            .values_list('category_id', 'subscriber_id'))
+    for category_id, user_id in rows.iterator(chunk_size=10000):
+        index[category_id].append(user_id)
+    return index
+
+
+def category_index(category_ids):
+    """То же, что load_index, но из кэша; в базу идут только категории, которых в кэше нет."""
+    category_ids = set(category_ids)
+    if not category_ids:
+        return {}
+    versions = tag_versions([_tag(pk) for pk in category_ids])
+    keys = {pk: f'{_tag(pk)}:{versions[_tag(pk)]}' for pk in category_ids}
+    found = cache.get_many(keys.values())
+
+    index = {pk: _unpack(found[key]) for pk, key in keys.items() if key in found}
+    missing = category_ids - index.keys()
+    if missing:
+        loaded = load_index(missing)
+        cache.set_many({keys[pk]: ids.tobytes() for pk, ids in loaded.items()}, INDEX_TIMEOUT)
+        index.update(loaded)
+    return index
+
+
+def subscribers_of(category_ids):
+    """Отсортированные id пользователей, подписанных хотя бы на одну из категорий, без повторов."""
+    return sorted(set().union(*category_index(category_ids).values()))
+
+
+def invalidate_subscribers(category_ids):
+    tags = [_tag(pk) for pk in set(category_ids)]
+    if tags:
+        transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+def subscribe(user_ids, category_ids, batch_size=5000):
+    """Подписывает каждого из user_ids на каждую из category_ids; существующие подписки не дублируются."""
+    user_ids, category_ids = set(user_ids), set(category_ids)
+    CategorySubscribe.objects.bulk_create(
+        [CategorySubscribe(subscriber_id=user_id, category_id=category_id)
+         for user_id in user_ids for category_id in category_ids],
+        batch_size=batch_size, ignore_conflicts=True,
+    )
+    invalidate_subscribers(category_ids)
+
+
+def unsubscribe(user_ids, category_ids, batch_size=1000):
+    """Отписывает user_ids от category_ids, возвращает число удалённых подписок."""
+    category_ids = sorted(set(category_ids))
+    if not category_ids:
+        return 0
+    deleted = 0
+    # индекс сбрасывается один раз на все категории, поэтому сигналы по каждой подписке не нужны
+    with transaction.atomic():
+        for chunk in chunked(sorted(set(user_ids)), batch_size):
+            deleted += delete_rows(CategorySubscribe, subscriber=chunk, category=category_ids)
+        invalidate_subscribers(category_ids)
+    return deleted
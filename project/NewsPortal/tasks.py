@@ -1,47 +1,56 @@
-from datetime import datetime
+from smtplib import SMTPException
 from celery import shared_task
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from NewsPortal.models import Post, Category
-from NewsPortal.signals import post_for_subscribers
+from NewsPortal.censorship import recensor_all
+from NewsPortal.digest import send_weekly_digest
+from NewsPortal.mailing import chunked, recipients, send_post_messages
+from NewsPortal.models import Post, PostCategory
+from NewsPortal.outbox import dispatch_outbox
+from NewsPortal.subscriptions import subscribers_of
+from NewsPortal.votes import flush_rating_deltas
 from project import settings
 
 
 @shared_task
 def send_post_for_subscribers_celery(post_pk):
-    post = Post.objects.get(id=post_pk)
-    categories = post.category.all()
-    subscribers_all = []
-    for category in categories:
-        subscribers_all += category.subscribe.all()
-    subscribers_list = {}
-    for person in subscribers_all:
-        subscribers_list[person.username] = person.email
-    for n in subscribers_list.items():
-        post_for_subscribers(n[0], post.title, post.text[:50], n[1], post.pk)
+    # одна задача на пачку подписчиков: пачки отправляются и перезапускаются независимо.
+    # Подписчики берутся из индекса в кэше, в задачу уходят только их id
+    chunks = 0
+    category_ids = PostCategory.objects.filter(post_id=post_pk).values_list('category_id', flat=True)
+    for chunk in chunked(subscribers_of(category_ids), settings.SUBSCRIBERS_CHUNK_SIZE):
+        send_post_chunk.delay(post_pk, chunk)
+        chunks += 1
+    return chunks
+
+
+@shared_task(bind=True, max_retries=5)
+def send_post_chunk(self, post_pk, user_ids):
+    post = Post.objects.filter(pk=post_pk).first()
+    if post is None:
+        return 0
+    sent = set()
+    try:
+        return send_post_messages(post, recipients(user_ids), sent=sent)
+    except (SMTPException, OSError) as exc:
+        # повтор только для тех, кому письмо ещё не ушло, иначе первые получатели получат его дважды
+        remaining = [user_id for user_id in user_ids if user_id not in sent]
+        raise self.retry(args=(post_pk, remaining), exc=exc, countdown=60 * 2 ** self.request.retries)
 
 
 @shared_task
 def weekly_post():
-    today = datetime.datetime.now()
-    day_week_ago = today - datetime.timedelta(days=7)
-    posts = Post.objects.filter(date_post__gte=day_week_ago)
-    categories = set(posts.values_list('category__name', flat=True))
-    subscribers = set(Category.objects.filter(name__in=categories).values_list('subscribe__email', flat=True))
-
-    html_content = render_to_string('posts/posts_created_last_week.html',{
-            'link': f'http://127.0.0.1:8000',
-            'posts': posts,
-        }
-    )
-    msg = EmailMultiAlternatives(
-        subject="Новости за неделю",
-        body='',
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        to=subscribers,
-    )
-    msg.attach_alternative(html_content, 'text/html')
-    msg.send()
+    return send_weekly_digest()
 
 
+@shared_task
+def flush_votes():
+    return flush_rating_deltas()
+
+
+@shared_task
+def dispatch_outbox_events():
+    return dispatch_outbox()
+
 
+@shared_task
+def recensor_posts():
+    return recensor_all()
@@ -1,13 +1,14 @@
 from django import template
 
+from NewsPortal.censorship import censor_cached
+
 register = template.Library()
 
-censored_word = ["образование"]
 
+# У постов и комментариев есть готовые поля *_censored, фильтр — для остальных строк.
+# Словарь хранится в базе (CensoredWord), результат для одинаковых строк кэшируется
 @register.filter()
 def censor(value):
-    for word in censored_word:
-        if word.lower() in value.lower():
-            value = value.replace(word[2:], '*' * len(word))
-    return value
-
+    if not isinstance(value, str):
+        return value
+    return censor_cached(value)
@@ -11,5 +11,6 @@ class CategoryTranslationOptions(TranslationOptions):
 
 @register(Post)
 class PostTranslationOptions(TranslationOptions):
-    fields = ('author', 'type', 'time_in', 'category', 'title', 'text', 'rating'
-)
\ No newline at end of file
+    # переводим только содержимое: автор, тип, дата, категории и рейтинг у поста одни на все языки.
+    # Версии после цензуры и выдержка для списков тоже свои у каждого языка
+    fields = ('title', 'text', 'title_censored', 'text_censored', 'excerpt')
\ No newline at end of file
@@ -1,27 +1,61 @@
+from django.conf import settings
 from django.urls import path
 from .views import (PostList, PostDetailView, PostCreate, PostUpdate, PostDelete, SearchResultsView, ArticleDelete,
                     ArticleUpdate, ArticleCreate, ArticleDetailView, byebye, AppointmentView, CategoryPost,
-                    AddCategoryView, CategoryList, subscribe_to_category, posts_created_last_week, Index)
-from django.views.decorators.cache import cache_page
+                    AddCategoryView, CategoryList, subscribe_to_category, posts_created_last_week, Index,
+                    TopAuthorsView, vote, ExportPostsView)
+from .models import LIKE, DISLIKE
+from .caching import cache_page_tagged, conditional_post_page, post_page_tags
+from .api import category_list_api, comment_list_api, post_detail_api, post_list_api
+from .feeds import feed_view
+from .instrumentation import metrics_view
+
+# страницы кэшируются надолго и сбрасываются тегами при изменении поста, автора или категории
+# поверх кэша страницы поста — условный GET по версии поста (conditional_post_page): повторный запрос получает 304
+cache_post_page = cache_page_tagged(lambda request, pk: post_page_tags(pk))
+cache_category_page = cache_page_tagged(lambda request, pk: [f'category:{pk}'])
+
+# страницы чтения: под ASGI — async-версии (settings.ASYNC_VIEWS), иначе обычные представления
+if settings.ASYNC_VIEWS:
+    from .async_views import article_detail, category_posts, post_detail, post_list, search_results
+else:
+    post_list = PostList.as_view()
+    post_detail = PostDetailView.as_view()
+    article_detail = ArticleDetailView.as_view()
+    category_posts = CategoryPost.as_view()
+    search_results = SearchResultsView.as_view()
 
 urlpatterns = [
-    path('posts/', PostList.as_view(), name='post_list'),
+    path('posts/', post_list, name='post_list'),
     path('posts_created_last_week/', posts_created_last_week, name='posts_created_last_week'),
-    path('news/<int:pk>/', cache_page(60*5)(PostDetailView.as_view()), name='some_news'),
+    path('posts/export/', ExportPostsView.as_view(), name='posts_export'),
+    path('news/<int:pk>/', conditional_post_page(post_detail, cache_page=cache_post_page), name='some_news'),
+    path('news/<int:pk>/like/', vote, {'kind': 'post', 'value': LIKE}, name='post_like'),
+    path('news/<int:pk>/dislike/', vote, {'kind': 'post', 'value': DISLIKE}, name='post_dislike'),
+    path('comment/<int:pk>/like/', vote, {'kind': 'comment', 'value': LIKE}, name='comment_like'),
+    path('comment/<int:pk>/dislike/', vote, {'kind': 'comment', 'value': DISLIKE}, name='comment_dislike'),
     path('news/create/', PostCreate.as_view(), name='new_post'),
     path('news/<int:pk>/edit/', PostUpdate.as_view(), name='post_edit'),
     path('news/<int:pk>/delete/', PostDelete.as_view(), name='post_delete'),
-    path('search/', SearchResultsView.as_view(), name='search'),
-    path('article/<int:pk>/', cache_page(60*5) (ArticleDetailView.as_view()), name='article'),
+    path('search/', search_results, name='search'),
+    path('article/<int:pk>/', conditional_post_page(article_detail, cache_page=cache_post_page), name='article'),
     path('article/create/', ArticleCreate.as_view(), name='new_article'),
     path('article/<int:pk>/edit/', ArticleUpdate.as_view(), name='article_edit'),
     path('article/<int:pk>/delete/', ArticleDelete.as_view(), name='article_delete'),
     path('byebye/', byebye, name='byebye'),
     path('appointment_created/', AppointmentView.as_view(), name='appointment_created'),
     path('make_appointment/', AppointmentView.as_view(), name='make_appointment'),
-    path('category/<int:pk>/', CategoryPost.as_view(), name='category'),
+    path('category/<int:pk>/', cache_category_page(category_posts), name='category'),
     path('add_category/', AddCategoryView.as_view(), name='add_category'),
     path('category_list/', CategoryList.as_view(), name='category_list'),
     path('category/<int:pk>/subscribe', subscribe_to_category),
     path('index/', Index.as_view()),
+    path('authors/top/', TopAuthorsView.as_view(), name='top_authors'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('feeds/<str:fmt>/', feed_view, name='feed'),
+    path('category/<int:pk>/feeds/<str:fmt>/', feed_view, name='category_feed'),
+    path('api/v1/posts/', post_list_api, name='api_posts'),
+    path('api/v1/posts/<int:pk>/', post_detail_api, name='api_post'),
+    path('api/v1/posts/<int:pk>/comments/', comment_list_api, name='api_post_comments'),
+    path('api/v1/categories/', category_list_api, name='api_categories'),
 ]
\ No newline at end of file
@@ -1,32 +1,44 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.contrib.auth.models import User
-from django.core.mail import mail_admins, send_mail, EmailMultiAlternatives
-from django.http import HttpResponseBadRequest, HttpResponse
+from django.core.exceptions import BadRequest
+from django.core.mail import mail_admins, EmailMultiAlternatives
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponseBadRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.http import require_POST
 from django.views.generic import (ListView, DetailView, CreateView, UpdateView, DeleteView)
-from .models import Post, Appointment, Category, CategorySubscribe
+from .models import Post, Appointment, Author, Category, UserPostCounter
+from .caching import CACHE_TIMEOUT, get_or_set_tagged, post_page_tags, tags_version
+from .export import CONTENT_TYPES, export_lines, export_queryset
 from .filters import PostFilter
-from .forms import PostForm
-from django.db.models import Q
+from .forms import ExportForm, PostForm
+from .pagination import KeysetPaginationMixin, paginate_by_cursor
+from .querybudget import QueryBudgetMixin
+from .rows import post_rows, post_values
+from .search import search_posts
+from .subscriptions import subscribe
+from .tasks import send_post_for_subscribers_celery
+from .votes import cast_vote
 from project import settings
 from django.core.cache import cache
 from django.utils.translation import gettext as _ # импортируем функцию для перевода
 
 
-class PostList(ListView):
+class PostList(QueryBudgetMixin, KeysetPaginationMixin, ListView):
     model = Post
     ordering = '-time_in'
     template_name = 'posts/posts.html'
     context_object_name = 'posts'
     paginate_by = 10
+    query_budget = 12  # не зависит от размера страницы
+    page_transform = staticmethod(post_rows)
 
     @method_decorator(login_required)
     def posts(request):
@@ -35,23 +47,23 @@ class PostList(ListView):
         return render(request, 'NewsPortal/posts.html', context)
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        self.filterset = PostFilter(self.request.GET, queryset)
-        return self.filterset.qs
+        # строки списка без полного текста: автор одним JOIN, категории страницы одним запросом
+        self.filterset = PostFilter(self.request.GET, super().get_queryset())
+        return post_values(self.filterset.qs)
 
     def get_context_data(self, **kwards):
         context = super().get_context_data(**kwards)
-        today = datetime.utcnow().date()
-        # фильтр по текущему пользователю и дате создания
-        q_user = Q(author=self.request.user)
-        q_date = Q(time_in__gte=today, time_in__lt=today + timedelta(days=1))
-        today_posts = self.model.objects.filter(q_user, q_date)
-        user_posts_count = self.model.objects.filter(author=self.request.user).count()
-        context['user_today_posts_count'] = today_posts.count()
-        context['user_posts_count'] = user_posts_count
+        if self.request.user.is_authenticated:
+            # счётчики постов пользователя ведутся сигналами, здесь одно чтение по ключу
+            counts = UserPostCounter.objects.counts(self.request.user.pk)
+            context['user_today_posts_count'] = counts.today
+            context['user_posts_count'] = counts.total
+            context['user_daily_post_limit'] = counts.limit
         context['time_now'] = datetime.utcnow()
         context['next_post'] = None
         context['filterset'] = self.filterset
+        context['cache_timeout'] = CACHE_TIMEOUT
+        context['cache_version'] = tags_version(['posts'])
         return context
 
 
@@ -60,18 +72,15 @@ class PostDetailView(DetailView):
     model = Post
     template_name = 'posts/some_news.html'
     context_object_name = 'some_news'
-    queryset = Post.objects.all()
+    # в кэш объект попадает вместе с автором и категориями
+    queryset = Post.objects.select_related('author').prefetch_related('category')
 
     def get_object(self, *args, **kwargs):  # переопределяем метод получения объекта, как ни странно
-        obj = cache.get(f'post-{self.kwargs["pk"]}',
-                        None)  # кэш очень похож на словарь, и метод get действует так же. Он забирает значение по ключу, если его нет, то забирает None.
-
-        # если объекта нет в кэше, то получаем его и записываем в кэш
-        if not obj:
-            obj = super().get_object(queryset=self.queryset)
-            cache.set(f'post-{self.kwargs["pk"]}', obj)
-
-        return obj
+        # объект кэшируется с тегами страницы поста (пост, автор, категории): переименование автора
+        # или категории тоже сбрасывает его, см. NewsPortal.caching
+        pk = self.kwargs['pk']
+        return get_or_set_tagged(f'post-{pk}', post_page_tags(pk),
+                                 lambda: super(PostDetailView, self).get_object(queryset=self.queryset))
 
 
 # Создание новости
@@ -82,14 +91,13 @@ class PostCreate(PermissionRequiredMixin, CreateView):
     permission_required = ('NewsPortal.add_post',)
 
 
+    @transaction.atomic
     def form_valid(self, form):
-        # Фильтр по автору и дате создания (за последние 24 часа)
-        author = self.request.user
-        now = timezone.now()
-        since_24_hours = now - timezone.timedelta(days=1)
-        posts_count = Post.objects.filter(author=author, time_in__gte=since_24_hours).count()
-        if posts_count >= 3:
-            # Если пользователь уже создал 3 или более постов за последние 24 часа, то отправляем ошибку
+        # Лимит постов в сутки (DailyPostLimit, по умолчанию 3) проверяем по счётчику пользователя;
+        # строка пользователя заблокирована до конца транзакции, так что лимит не обойти параллельными запросами
+        counts = UserPostCounter.objects.counts(self.request.user.pk, lock=True)
+        if not counts.can_create:
+            # Если пользователь уже создал все посты, разрешённые на сегодня, то отправляем ошибку
             return HttpResponseBadRequest(f'{self.request.user.username}, Вы превысили лимит по количеству создаваемых'
                                           f' постов в сутки.')
         else:
@@ -97,41 +105,41 @@ class PostCreate(PermissionRequiredMixin, CreateView):
             response = super().form_valid(form)
             self.success_url = reverse_lazy('new_post', kwargs={'pk': self.object.id})
             post = self.object
-            post_url = self.request.build_absolute_uri(reverse('some_news', args=[post.pk]))
-            categories = post.category.all()
-            category_name = []
-            subscribers_emails = []
-
-            for category in categories:
-                category_name.append(category.name)
-                subscribers = category.subscribe.all()
-                subscribers_emails += [sub.email for sub in subscribers]
-
-            for subscriber in subscribers:
-                username = subscriber.username
-
-            send_mail(
-                subject=f'{post.title}"{category_name}"',
-                message=f'Здравствуй {username}. Новая статья в твоём любимом разделе! {post.text[:50]}'
-                        f'\n\n Ссылка на новый пост: {post_url}',
-                from_email= settings.DEFAULT_FROM_EMAIL,
-                recipient_list= subscribers_emails
-            )
+            # рассылка подписчикам уходит в фон после коммита, см. NewsPortal.tasks
+            transaction.on_commit(lambda: send_post_for_subscribers_celery.delay(post.pk))
             return response
 
 
 def posts_created_last_week(request):
     now = timezone.now()
     since_one_week = now - timezone.timedelta(weeks=1)
-    posts = Post.objects.filter(time_in__gte=since_one_week).order_by('-time_in')
+    posts = post_rows(post_values(Post.objects.filter(time_in__gte=since_one_week).order_by('-time_in')))
 
     context = {
         'posts': posts,
+        'since': since_one_week,
     }
 
     return render(request, 'posts/posts_created_last_week.html', context)
 
 
+# Выгрузка постов за период для редакторов: /posts/export/?since=2024-01-01&until=2024-01-31&category=1&format=csv
+class ExportPostsView(PermissionRequiredMixin, View):
+    permission_required = ('NewsPortal.change_post',)
+
+    def get(self, request):
+        form = ExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+        data = form.cleaned_data
+        queryset = export_queryset(data['since'], data['until'], data['category'])
+        # строки пишутся в ответ по мере чтения из базы, целиком выгрузка в памяти не собирается
+        response = StreamingHttpResponse(export_lines(data['format'], queryset), content_type=CONTENT_TYPES[data['format']])
+        period = '-'.join(str(day) for day in (data['since'], data['until']) if day) or 'all'
+        response['Content-Disposition'] = f'attachment; filename="posts-{period}.{data["format"]}"'
+        return response
+
+
 # Редактирование новости
 class PostUpdate(PermissionRequiredMixin, UpdateView):
     form_class = PostForm
@@ -151,21 +159,28 @@ class PostDelete(DeleteView):
 class SearchResultsView(ListView):
     model = Post
     template_name = 'search.html'
+    context_object_name = 'posts'
+    paginate_by = 10
 
     def get_queryset(self):
-        query = self.request.GET.get('q')
-        category_id = self.request.GET.get('Category')
-        object_list = Post.objects.filter(
-            Q(title__icontains=query) |
-            Q(text__icontains=query) |
-            Q(time_in__icontains=query) |
-            Q(rating__icontains=query) |
-            Q(type__icontains=query)
-        )
-        if category_id:
-            object_list = object_list.filter(category__id=category_id)
-        object_list = object_list.distinct()
-        return object_list
+        # полнотекстовый поиск по индексу с ранжированием, см. NewsPortal.search
+        # в таблице результатов только выдержка, полный текст не читаем
+        return search_posts(self.request.GET.get('q'), self.get_category_id()).defer('text', 'text_censored', 'search_vector')
+
+    def get_category_id(self):
+        # ?Category= подставляется в фильтр как число: мусор в адресе — 400, а не ValueError из базы
+        raw = self.request.GET.get('Category')
+        if not raw:
+            return None
+        try:
+            return int(raw)
+        except ValueError:
+            raise BadRequest('Неверная категория')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
 
 
 # Конкретная статья
@@ -173,6 +188,7 @@ class ArticleDetailView(DetailView):
     model = Post
     template_name = 'articles/article.html'
     context_object_name = 'article'
+    queryset = Post.objects.select_related('author').prefetch_related('category')
 
     def get_context_data(self, **kwargs):
         context = super(ArticleDetailView, self).get_context_data(**kwargs)
@@ -254,14 +270,26 @@ class AppointmentView(View):
 
 
 # Категория:
-class CategoryPost(DetailView):
+class CategoryPost(QueryBudgetMixin, DetailView):
     model = Category
+    queryset = Category.objects.select_related('stats')
     template_name = 'categories/post_category.html'
     context_object_name = 'postcategory'
 
+    paginate_by = 10
+    query_budget = 8
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['posts'] = Post.objects.filter(category=kwargs['object'])
+        category = kwargs['object']
+        posts = post_values(Post.objects.filter(category=category))
+        # количество постов берём из счётчика категории, а не COUNT(*)
+        stats = getattr(category, 'stats', None)
+        paginator, page = paginate_by_cursor(self.request, posts, self.paginate_by, count_mode='estimate',
+                                             count=stats.post_count if stats else None, transform=post_rows)
+        context['paginator'] = paginator
+        context['page_obj'] = page
+        context['posts'] = page.object_list
         return context
 
 
@@ -275,15 +303,59 @@ class AddCategoryView(CreateView):
 # Список категорий:
 class CategoryList(ListView):
     model = Category
+    # счётчики постов приходят тем же запросом, см. CategoryStats
+    queryset = Category.objects.select_related('stats').order_by('name')
     template_name = 'categories/category_list.html'
     context_object_name = 'category'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cache_timeout'] = CACHE_TIMEOUT
+        context['cache_version'] = tags_version(['categories'])
+        return context
+
 
-# Функция позволяющая подписаться на категорию
-def subscribe_to_category(request, pk):
+# Голосование за пост или комментарий: пишем голос в буфер, рейтинг обновит задача flush_votes
+@require_POST
+@login_required
+def vote(request, kind, pk, value):
+    try:
+        delta = cast_vote(request.user.pk, kind, pk, value)
+    except IntegrityError:
+        raise Http404
+    return JsonResponse({'delta': delta})
+
+
+# Лучшие авторы: рейтинги поддерживаются дельтами, так что здесь только чтение топа из кэша
+TOP_AUTHORS_CACHE_KEY = 'top-authors'
+TOP_AUTHORS_CACHE_TIMEOUT = 60 * 5
+# в кэше один самый длинный топ, вызывающие берут из него начало нужной длины
+TOP_AUTHORS_MAX = 100
 
-    current_user = request.user
-    CategorySubscribe.objects.create(category=Category.objects.get(pk=pk), subscriber=User.objects.get(pk=current_user.id))
+
+def top_authors(limit=10):
+    authors = cache.get_or_set(
+        TOP_AUTHORS_CACHE_KEY,
+        lambda: list(Author.objects.order_by('-user_rating', 'pk').values('name', 'user_rating')[:TOP_AUTHORS_MAX]),
+        TOP_AUTHORS_CACHE_TIMEOUT,
+    )
+    return authors[:limit]
+
+
+class TopAuthorsView(ListView):
+    template_name = 'authors/top_authors.html'
+    context_object_name = 'authors'
+
+    def get_queryset(self):
+        return top_authors()
+
+
+# Функция позволяющая подписаться на категорию (повторная подписка ничего не меняет)
+@login_required
+def subscribe_to_category(request, pk):
+    if not Category.objects.filter(pk=pk).exists():
+        raise Http404
+    subscribe([request.user.pk], [pk])
 
     return render(request, 'subscribe.html')
 
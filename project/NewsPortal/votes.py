@@ -0,0 +1,79 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .caching import invalidate_tags
+from .models import Author, Comment, CommentVote, Post, PostVote, RatingDelta, touch_posts
+
+
+VOTE_TARGETS = {
+    'post': (PostVote, 'post_id'),
+    'comment': (CommentVote, 'comment_id'),
+}
+
+
+def cast_vote(user_id, kind, target_id, value):
+    """
+    Учитывает голос пользователя за пост или комментарий.
+
+    Строку поста не трогаем: пишем голос (уникален для пары пользователь-объект)
+    и дельту в буфер RatingDelta. Возвращает изменение рейтинга, 0 — голос уже был учтён.
+    """
+    model, field = VOTE_TARGETS[kind]
+    with transaction.atomic():
+        vote, created = model.objects.select_for_update().get_or_create(
+            user_id=user_id, **{field: target_id}, defaults={'value': value},
+        )
+        if created:
+            delta = value
+        elif vote.value == value:
+            return 0
+        else:
+            delta = value - vote.value
+            vote.value = value
+            vote.save(update_fields=['value'])
+        RatingDelta.objects.create(delta=delta, **{field: target_id})
+    return delta
+
+
+def _rating_delta(totals):
+    return F('rating') + Case(*[When(pk=pk, then=Value(delta)) for pk, delta in totals.items()], default=Value(0))
+
+
+def flush_rating_deltas(batch_size=5000):
+    """Переносит накопленные голоса в рейтинги постов, комментариев и авторов, пачка = одна транзакция."""
+    flushed = 0
+    while True:
+        with transaction.atomic():
+            batch = list(RatingDelta.objects.select_for_update(skip_locked=True).order_by('pk')
+                         .values_list('pk', 'post_id', 'comment_id', 'delta')[:batch_size])
+            if not batch:
+                break
+            posts, comments = Counter(), Counter()
+            for pk, post_id, comment_id, delta in batch:
+                if post_id is not None:
+                    posts[post_id] += delta
+                if comment_id is not None:
+                    comments[comment_id] += delta
+            posts = {pk: delta for pk, delta in posts.items() if delta}
+            comments = {pk: delta for pk, delta in comments.items() if delta}
+
+            # рейтинг виден на странице поста, поэтому версия поста сдвигается вместе с ним
+            if posts:
+                touch_posts(Post.objects.filter(pk__in=posts), rating=_rating_delta(posts))
+            if comments:
+                Comment.objects.filter(pk__in=comments).update(rating=_rating_delta(comments))
+
+            author_deltas = [(author_id, 3 * posts[pk]) for pk, author_id in
+                             Post.objects.filter(pk__in=posts).values_list('pk', 'author_id')]
+            for pk, user_id, post_author_id in (Comment.objects.filter(pk__in=comments)
+                                                .values_list('pk', 'user_id', 'post__author_id')):
+                author_deltas += [(user_id, comments[pk]), (post_author_id, comments[pk])]
+            Author.objects.add_rating(author_deltas)
+
+            RatingDelta.objects.filter(pk__in=[row[0] for row in batch]).delete()
+
+        invalidate_tags(*[f'post:{pk}' for pk in posts])
+        flushed += len(batch)
+    return flushed
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+# под ASGI страницы чтения работают как async-представления (settings.ASYNC_VIEWS), NEWSPORTAL_ASYNC_VIEWS=0 — отключить
+os.environ.setdefault('NEWSPORTAL_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -13,4 +13,17 @@ app.conf.beat_schedule = {
         'task': 'NewsPortal.tasks.weekly_post',
         'schedule': crontab(hour=8, minute=0, day_of_week='monday'),
     },
-}
\ No newline at end of file
+    'flush_votes': {
+        'task': 'NewsPortal.tasks.flush_votes',
+        'schedule': 10.0,  # раз в 10 секунд переносим накопленные голоса в рейтинги
+    },
+}
+
+
+@app.on_after_configure.connect
+def setup_outbox_schedule(sender, **kwargs):
+    # интервал сводок менеджерам берётся из настроек: не чаще одной сводки за OUTBOX_DIGEST_INTERVAL секунд
+    from django.conf import settings
+    sender.add_periodic_task(settings.OUTBOX_DIGEST_INTERVAL,
+                             sender.signature('NewsPortal.tasks.dispatch_outbox_events'),
+                             name='dispatch_outbox')
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django.contrib.sites',
     'django.contrib.flatpages',
+    'django.contrib.postgres',
     'fpages',
     'NewsPortal.apps.NewsportalConfig',
     'django_filters',
@@ -58,6 +59,8 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    # первым, чтобы замерять все остальные: Server-Timing и метрики на /metrics/
+    'NewsPortal.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,9 +69,6 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware',
-    'django.middleware.cache.UpdateCacheMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.cache.FetchFromCacheMiddleware',
     'django.middleware.locale.LocaleMiddleware',
 ]
 
@@ -195,6 +195,17 @@ SERVER_EMAIL = '***********'
 
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# адрес сайта для ссылок в письмах
+SITE_URL = 'http://127.0.0.1:8000'
+
+# сколько подписчиков обрабатывает одна задача рассылки (одно SMTP-соединение на пачку)
+SUBSCRIBERS_CHUNK_SIZE = 500
+
+# Сводки менеджерам об изменениях постов (NewsPortal.outbox): раз в столько секунд,
+# не больше OUTBOX_BATCH_SIZE событий за раз, остальное уходит следующей сводкой
+OUTBOX_DIGEST_INTERVAL = 60.0
+OUTBOX_BATCH_SIZE = 1000
+
 # формат даты, которую будет воспринимать наш задачник (вспоминаем модуль по фильтрам)
 APSCHEDULER_DATETIME_FORMAT = "N j, Y, f:s a"
 
@@ -210,14 +221,38 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
 
+# Защита от одновременного пересчёта страниц (NewsPortal.caching.get_or_recompute) держится на cache.add().
+# Между процессами он атомарен только в Redis и Memcached: с FileBasedCache при наплыве запросов
+# страницу могут пересчитать несколько воркеров сразу. В продакшене лучше RedisCache.
 CACHES = {
     'default': {
         'TIMEOUT': 60, # добавляем стандартное время ожидания в минуту (по умолчанию это 5 минут — 300 секунд)
-        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'BACKEND': 'NewsPortal.instrumentation.InstrumentedFileBasedCache',  # FileBasedCache + счётчики попаданий
         'LOCATION': os.path.join(BASE_DIR, 'cache_files'), # Указываем, куда будем сохранять кэшируемые файлы! Не забываем создать папку cache_files внутри папки с manage.py!
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
     }
 }
 
+# Страницы и объекты, помеченные тегами (NewsPortal.caching), сбрасываются при изменениях,
+# поэтому могут жить часами, а не минуту
+TAGGED_CACHE_TIMEOUT = 60 * 60 * 6
+# после истечения или сброса запись ещё столько секунд отдаётся, пока один запрос её пересчитывает
+CACHE_STALE_GRACE = 60 * 5
+
+# Кому отдаётся /metrics/ (NewsPortal.instrumentation.metrics_view) вне DEBUG: адресам скрейпера Prometheus
+# из NEWSPORTAL_METRICS_ALLOWED_IPS (через запятую) или запросу с заголовком Authorization: Bearer <токен>,
+# если задан NEWSPORTAL_METRICS_TOKEN. Остальным — 404. По умолчанию не открыто никому: за nginx на той же
+# машине REMOTE_ADDR у всех запросов 127.0.0.1, так что доступ по адресу включается только явно
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('NEWSPORTAL_METRICS_ALLOWED_IPS', '').split(',')
+                       if ip.strip()]
+METRICS_TOKEN = os.environ.get('NEWSPORTAL_METRICS_TOKEN', '')
+
+# async-версии страниц чтения (лента, пост, статья, категория, поиск), см. NewsPortal.async_views.
+# project/asgi.py включает их сам; под WSGI остаются обычные представления
+ASYNC_VIEWS = os.environ.get('NEWSPORTAL_ASYNC_VIEWS') == '1'
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,